@@ -12,9 +12,32 @@ from .__meta__ import (
     __license__,
 )
 from .fcm import FCMNotification
+from .batch import MessageBatch
+from .limiter import AdaptiveConcurrencyLimiter
+from .breaker import CircuitBreaker
+from .timeouts import Deadline, Timeout
+from .priority import PriorityScheduler, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK
+from .sinks import ResultSink, CallbackSink, NDJSONSink, SQLiteSink
+from .profiling import Profiler
+from .delivery import DeliveryScheduler
 
 __all__ = [
     "FCMNotification",
+    "MessageBatch",
+    "AdaptiveConcurrencyLimiter",
+    "CircuitBreaker",
+    "Deadline",
+    "Timeout",
+    "PriorityScheduler",
+    "PRIORITY_HIGH",
+    "PRIORITY_NORMAL",
+    "PRIORITY_BULK",
+    "ResultSink",
+    "CallbackSink",
+    "NDJSONSink",
+    "SQLiteSink",
+    "Profiler",
+    "DeliveryScheduler",
     "__title__",
     "__summary__",
     "__url__",
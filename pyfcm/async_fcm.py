@@ -1,41 +1,338 @@
 import asyncio
+import copy
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import aiohttp
 import json
+from urllib.parse import urlsplit
+
+from pyfcm.errors import FCMTimeoutError, InvalidDataError
+from pyfcm.priority import PRIORITY_NORMAL
+from pyfcm.profiling import stage
+from pyfcm.responses import extract_error, extract_name
+from pyfcm.sinks import make_record
+from pyfcm.timeouts import aiohttp_timeout
+
+# Returned, as a copy per message, in place of a response for messages rejected by an open circuit breaker
+CIRCUIT_OPEN_RESPONSE = {
+    "error": {
+        "code": 503,
+        "status": "UNAVAILABLE",
+        "message": "FCM circuit breaker is open, the request was not sent",
+    }
+}
+
+# Returned, as a copy per message, in place of a response for messages cancelled by the batch deadline
+DEADLINE_EXCEEDED_RESPONSE = {
+    "error": {
+        "code": 504,
+        "status": "DEADLINE_EXCEEDED",
+        "message": "The batch deadline expired before the request completed",
+    }
+}
+
+# Returned, as a copy per message, in place of a response for requests that timed out
+REQUEST_TIMEOUT_RESPONSE = {
+    "error": {
+        "code": 504,
+        "status": "DEADLINE_EXCEEDED",
+        "message": "The request timed out before FCM answered",
+    }
+}
+
+# Returned, as a copy per message, in place of a response for requests that could not reach FCM
+CONNECTION_ERROR_RESPONSE = {
+    "error": {
+        "code": 503,
+        "status": "UNAVAILABLE",
+        "message": "The connection to FCM failed before it answered",
+    }
+}
+
+# Number of requests a batch keeps in flight unless told otherwise
+DEFAULT_CONCURRENCY = 1000
+
+_PENDING = object()
 
 
-async def fetch_tasks(end_point, headers, payloads, timeout):
+async def fetch_tasks(
+    end_point,
+    headers,
+    payloads,
+    timeout,
+    limiter=None,
+    breaker=None,
+    deadline=None,
+    scheduler=None,
+    priority=PRIORITY_NORMAL,
+    tenant=None,
+    lean=False,
+    serialize=None,
+    concurrency=DEFAULT_CONCURRENCY,
+    warmup=0,
+    sink=None,
+    profiler=None,
+):
     """
+    Sends the batch through a fixed pool of workers sharing one client session.
+    Payloads are pulled from the iterable as workers become free, so generators
+    and lazy containers such as MessageBatch are never materialized.
 
     :param end_point (str) : FCM endpoint
     :param headers (dict) : FCM Request Headers
-    :param payloads (list) : payloads contains bytes after self.parse_payload
+    :param payloads (iterable) : payloads contains bytes after self.parse_payload,
+        or items turned into bytes by `serialize` just before sending
     :param timeout (int) : FCM timeout
-    :return:
+    :param limiter (AdaptiveConcurrencyLimiter) : optional limit on requests in flight
+    :param breaker (CircuitBreaker) : optional circuit breaker around the endpoint
+    :param deadline (Deadline) : optional batch deadline, requests still outstanding when it
+        expires are cancelled and reported as DEADLINE_EXCEEDED
+    :param scheduler (PriorityScheduler) : optional admission scheduler, used in place of the limiter
+    :param priority (str) : scheduler lane of the batch
+    :param tenant : scheduler tenant the batch is accounted to
+    :param lean (bool) : return message names and compact errors instead of decoded bodies
+    :param serialize (callable) : optional function turning an item of `payloads` into bytes,
+        items it rejects with InvalidDataError get an INVALID_ARGUMENT error
+    :param concurrency (int) : number of workers, the upper bound on requests in flight
+    :param warmup (int) : number of connections to open before the first message is sent. The
+        session lives as long as the batch, so this delays every batch by the handshakes
+    :param sink (ResultSink) : optional sink the outcome of every payload is written to, in
+        place of collecting the results
+    :param profiler (Profiler) : optional profiler timing the stages of each request
+    :return: one result per payload, in order, or None if a sink is given
     """
-    fetches = [
-        asyncio.Task(
-            send_request(
-                end_point=end_point, headers=headers, payload=payload, timeout=timeout
+    results = []
+    # items picked up by a worker and not completed yet, reported if the deadline cancels them
+    started = {}
+    jobs = enumerate(payloads)
+    # owned by the batch so no thread outlives it. Only workers facing a full sink queue use it,
+    # records reach the sink in completion order either way and are identified by their index
+    sink_executor = (
+        ThreadPoolExecutor(max_workers=1, thread_name_prefix="pyfcm-sink")
+        if sink is not None
+        else None
+    )
+
+    async def deliver(index, item, result):
+        if sink is None:
+            results[index] = result
+            return
+        record = make_record(index, item, result)
+        try:
+            sink.put_nowait(record)
+        except queue.Full:
+            # only this worker waits for the sink to catch up, the event loop keeps running
+            await asyncio.get_running_loop().run_in_executor(
+                sink_executor, sink.put, record
+            )
+
+    async def worker(session):
+        for index, item in jobs:
+            if sink is None:
+                results.append(_PENDING)
+            try:
+                payload = serialize(item) if serialize is not None else item
+            except InvalidDataError as e:
+                # only this message is rejected, the rest of the batch is still sent
+                error = {"code": 400, "status": "INVALID_ARGUMENT", "message": str(e)}
+                await deliver(index, item, {"error": error})
+                continue
+            started[index] = item
+            result = await send_request(
+                end_point=end_point,
+                headers=headers,
+                payload=payload,
+                timeout=timeout,
+                limiter=limiter,
+                breaker=breaker,
+                deadline=deadline,
+                scheduler=scheduler,
+                priority=priority,
+                tenant=tenant,
+                lean=lean,
+                session=session,
+                profiler=profiler,
             )
-        )
-        for payload in payloads
-    ]
-    return await asyncio.gather(*fetches)
+            del started[index]
+            await deliver(index, item, result)
+
+    try:
+        connector = aiohttp.TCPConnector(limit=0, use_dns_cache=True, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(
+            headers=headers, connector=connector
+        ) as session:
+            # the handshakes are part of the batch, so they are bounded by its deadline
+            warmup_timeout = 10 if deadline is None else min(10, deadline.remaining())
+            if warmup and warmup_timeout > 0:
+                await warm_connections(session, end_point, warmup, warmup_timeout)
+            if hasattr(payloads, "__len__"):
+                concurrency = max(1, min(concurrency, len(payloads)))
+            workers = [
+                asyncio.ensure_future(worker(session)) for _ in range(concurrency)
+            ]
+            done, pending = await asyncio.wait(
+                workers,
+                timeout=deadline.remaining() if deadline is not None else None,
+                return_when=asyncio.FIRST_EXCEPTION,
+            )
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+
+            # the deadline expired: report the cancelled requests and those never started
+            for index, item in sorted(started.items()):
+                await deliver(index, item, copy.deepcopy(DEADLINE_EXCEEDED_RESPONSE))
+            for index, item in jobs:
+                if sink is None:
+                    results.append(_PENDING)
+                await deliver(index, item, copy.deepcopy(DEADLINE_EXCEEDED_RESPONSE))
 
+        if sink is not None:
+            await asyncio.get_running_loop().run_in_executor(sink_executor, sink.flush)
+            return None
+        return results
+    finally:
+        if sink_executor is not None:
+            # idle once the flush is done, joining its thread is immediate
+            sink_executor.shutdown(wait=True)
 
-async def send_request(end_point, headers, payload, timeout=5):
+
+async def warm_connections(session, end_point, connections, timeout=10):
+    """
+    Opens `connections` keep-alive connections to the FCM host, DNS resolution and
+    TLS handshakes included, so they are ready in the session's pool
+
+    :param session (aiohttp.ClientSession) : session whose pool is warmed
+    :param end_point (str) : FCM endpoint
+    :param connections (int) : number of connections to open
+    :param timeout (int) : time limit of each connection attempt
+    :return: number of connections opened
+    """
+    url = urlsplit(end_point)
+    root = f"{url.scheme}://{url.netloc}/"
+    timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def connect():
+        try:
+            return await session.head(root, timeout=timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    # responses are only released once all are in, so no connection is reused for another
+    responses = await asyncio.gather(*[connect() for _ in range(connections)])
+    opened = [response for response in responses if response is not None]
+    for response in opened:
+        response.release()
+    return len(opened)
+
+
+async def send_request(
+    end_point,
+    headers,
+    payload,
+    timeout=5,
+    limiter=None,
+    breaker=None,
+    deadline=None,
+    scheduler=None,
+    priority=PRIORITY_NORMAL,
+    tenant=None,
+    lean=False,
+    session=None,
+    profiler=None,
+):
     """
 
     :param end_point (str) : FCM endpoint
     :param headers (dict) : FCM Request Headers
     :param payloads (list) : payloads contains bytes after self.parse_payload
-    :param timeout (int) : FCM timeout
-    :return:
+    :param timeout (int or Timeout) : FCM timeout
+    :param limiter (AdaptiveConcurrencyLimiter) : optional limit on requests in flight
+    :param breaker (CircuitBreaker) : optional circuit breaker around the endpoint
+    :param deadline (Deadline) : optional deadline bounding the request timeout
+    :param scheduler (PriorityScheduler) : optional admission scheduler, used in place of the limiter
+    :param priority (str) : scheduler lane of the request
+    :param tenant : scheduler tenant the request is accounted to
+    :param lean (bool) : return the message name, or a compact error built by
+        responses.extract_error, instead of the decoded body
+    :param session (aiohttp.ClientSession) : optional session to reuse, a new one is opened otherwise
+    :param profiler (Profiler) : optional profiler timing the admission, HTTP and parsing stages
+    :return: the decoded response, an UNAVAILABLE error if the circuit breaker is open,
+        a DEADLINE_EXCEEDED error if the deadline expired or the request timed out before it
+        completed, an UNAVAILABLE error if the connection failed, or None if the payload was handed to the breaker's `on_reject` callback
     """
-    timeout = aiohttp.ClientTimeout(total=timeout)
+    if breaker is not None and not breaker.allow_request():
+        if breaker.on_reject is not None:
+            breaker.on_reject(payload)
+            return None
+        return copy.deepcopy(CIRCUIT_OPEN_RESPONSE)
+
+    gate = scheduler if scheduler is not None else limiter
+    admission_timeout = deadline.remaining() if deadline is not None else None
+    try:
+        with stage(profiler, "admission"):
+            if scheduler is not None:
+                await scheduler.acquire_async(
+                    priority, tenant, timeout=admission_timeout
+                )
+            elif limiter is not None:
+                await limiter.acquire_async(timeout=admission_timeout)
+    except (asyncio.CancelledError, FCMTimeoutError) as e:
+        if breaker is not None:
+            breaker.cancel()
+        if isinstance(e, FCMTimeoutError):
+            return copy.deepcopy(DEADLINE_EXCEEDED_RESPONSE)
+        raise
+    started = time.monotonic()
+    status = None
+    cancelled = False
+    timeout = aiohttp_timeout(timeout, deadline)
+    try:
+        with stage(profiler, "http"):
+            if session is None:
+                async with aiohttp.ClientSession(
+                    headers=headers, timeout=timeout
+                ) as session:
+                    status, body = await _post(session, end_point, payload)
+            else:
+                status, body = await _post(session, end_point, payload, timeout)
+        with stage(profiler, "parse_response"):
+            if not lean:
+                return json.loads(body)
+            if status == 200:
+                return extract_name(body)
+            return extract_error(status, body)
+    except asyncio.CancelledError:
+        cancelled = status is None
+        raise
+    except asyncio.TimeoutError:
+        if deadline is not None and deadline.expired:
+            # the request timeout was cut short by the deadline
+            return copy.deepcopy(DEADLINE_EXCEEDED_RESPONSE)
+        return copy.deepcopy(REQUEST_TIMEOUT_RESPONSE)
+    except aiohttp.ClientError:
+        # reported for this message alone, the rest of the batch goes on
+        return copy.deepcopy(CONNECTION_ERROR_RESPONSE)
+    finally:
+        if cancelled:
+            # abandoned before a response, there is no outcome to learn from
+            if gate is not None:
+                gate.release()
+            if breaker is not None:
+                breaker.cancel()
+        else:
+            if gate is not None:
+                gate.release(time.monotonic() - started, status, dropped=status is None)
+            if breaker is not None:
+                breaker.record(status)
+
 
-    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
-        async with session.post(end_point, data=payload) as res:
-            result = await res.text()
-            result = json.loads(result)
-            return result
+async def _post(session, end_point, payload, timeout=None):
+    kwargs = {"timeout": timeout} if timeout is not None else {}
+    async with session.post(end_point, data=payload, **kwargs) as res:
+        return res.status, await res.read()
@@ -1,13 +1,16 @@
 # from __future__ import annotations
 
+import functools
 import json
+import socket
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
+from urllib.parse import urlsplit
 
 import requests
 from requests.adapters import HTTPAdapter
-from urllib3 import Retry
 from os import path
 from google.oauth2 import service_account
 from google.oauth2.credentials import Credentials
@@ -19,10 +22,28 @@ from pyfcm.errors import (
     FCMSenderIdMismatchError,
     FCMServerError,
     FCMNotRegisteredError,
+    FCMCircuitOpenError,
+    FCMTimeoutError,
 )
+from pyfcm.priority import PRIORITY_NORMAL
+from pyfcm.profiling import stage
+from pyfcm.responses import extract_error, extract_name
+from pyfcm.timeouts import requests_timeout, resolve_deadline
 
 # Migration to v1 - https://firebase.google.com/docs/cloud-messaging/migrate-v1
 
+# Keep-alive connections kept by the connection pool shared by all threads
+DEFAULT_POOL_MAXSIZE = 100
+
+# Threads opening the connections of `warmup`, each opens its share of them in turn
+WARMUP_MAX_THREADS = 32
+
+# Responses and connection errors retried by send_request, with exponential backoff
+RETRY_STATUS_CODES = frozenset([502, 503])
+MAX_RETRIES = 10
+RETRY_BACKOFF_FACTOR = 1
+RETRY_BACKOFF_MAX = 120
+
 
 class BaseAPI(object):
     FCM_END_POINT_BASE = "https://fcm.googleapis.com/v1/projects"
@@ -36,6 +57,12 @@ class BaseAPI(object):
         env: Optional[str] = None,
         json_encoder=None,
         adapter=None,
+        concurrency_limiter=None,
+        circuit_breaker=None,
+        scheduler=None,
+        lean_responses=False,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        profiler=None,
     ):
         """
         Override existing init function to give ability to use v1 endpoints of Firebase Cloud Messaging API
@@ -47,6 +74,17 @@ class BaseAPI(object):
             env (dict): environment settings dictionary, for example "app_engine"
             json_encoder (BaseJSONEncoder): JSON encoder
             adapter (BaseAdapter): adapter instance
+            concurrency_limiter (AdaptiveConcurrencyLimiter): limits requests in flight, shared by the sync and async paths
+            circuit_breaker (CircuitBreaker): fails fast while the FCM endpoint is unhealthy, shared by the sync and async paths
+            scheduler (PriorityScheduler): admits requests by priority lane and tenant, shared by the sync
+                and async paths. If `concurrency_limiter` is also set it drives the scheduler's capacity
+            lean_responses (bool): only extract the message name from successful responses instead of
+                decoding the whole body. `notify` then returns the name as a string, and the async path
+                returns names for successes and compact error dicts for failures
+            pool_maxsize (int): keep-alive connections kept by the pool shared by all threads,
+                ignored with a custom adapter
+            profiler (Profiler): times each stage of the sends, across threads and coroutines.
+                Its report is dumped at the end of each async batch, then its stats start over
         """
         if not (service_account_file or credentials):
             raise AuthenticationError(
@@ -58,6 +96,20 @@ class BaseAPI(object):
         self._project_id = project_id
         self.credentials = credentials
         self.custom_adapter = adapter
+        self.pool_maxsize = pool_maxsize
+        self._adapter = None
+        self._warm_connections = 0
+        # access token shared by the sessions of all threads, refreshed by one thread at a time
+        self._token_lock = threading.Lock()
+        self._token_headers = None
+        self._token_expiry = 0
+        self.concurrency_limiter = concurrency_limiter
+        self.circuit_breaker = circuit_breaker
+        self.scheduler = scheduler
+        self.lean_responses = lean_responses
+        self.profiler = profiler
+        if scheduler is not None and scheduler.limiter is None:
+            scheduler.limiter = concurrency_limiter
         self.thread_local = threading.local()
 
         if (
@@ -94,60 +146,373 @@ class BaseAPI(object):
         self._fcm_end_point = self.FCM_END_POINT_BASE + f"/{project_id}/messages:send"
         return self._fcm_end_point
 
+    @property
+    def adapter(self):
+        """
+        Transport adapter shared by the sessions of all threads, so that they share one connection pool
+        """
+        if self.custom_adapter is not None:
+            return self.custom_adapter
+        if self._adapter is None:
+            # no retries inside urllib3, send_request retries within the deadline instead
+            self._adapter = HTTPAdapter(pool_maxsize=self.pool_maxsize)
+        return self._adapter
+
     @property
     def requests_session(self):
         if getattr(self.thread_local, "requests_session", None) is None:
-            retries = Retry(
-                backoff_factor=1,
-                status_forcelist=[502, 503],
-                allowed_methods=(Retry.DEFAULT_ALLOWED_METHODS | frozenset(["POST"])),
-            )
-            adapter = self.custom_adapter or HTTPAdapter(max_retries=retries)
             self.thread_local.requests_session = requests.Session()
+            self.thread_local.adapter = None
+            self.thread_local.token_expiry = 0
+
+        adapter = self.adapter
+        if self.thread_local.adapter is not adapter:
             self.thread_local.requests_session.mount("http://", adapter)
             self.thread_local.requests_session.mount("https://", adapter)
-            self.thread_local.token_expiry = 0
+            self.thread_local.adapter = adapter
 
-        current_timestamp = time.time()
-        if self.thread_local.token_expiry < current_timestamp:
-            self.thread_local.requests_session.headers.update(self.request_headers())
-            self.thread_local.token_expiry = current_timestamp + 1800
+        if self.thread_local.token_expiry < time.time():
+            headers, expiry = self._shared_token()
+            self.thread_local.requests_session.headers.update(headers)
+            self.thread_local.token_expiry = expiry
         return self.thread_local.requests_session
 
-    def send_request(self, payload=None, timeout=None):
-        response = self.requests_session.post(
-            self.fcm_end_point, data=payload, timeout=timeout
-        )
-        if (
-            "Retry-After" in response.headers
-            and int(response.headers["Retry-After"]) > 0
+    def _shared_token(self):
+        """
+        The access token headers cached for all threads and their expiry, refreshed if
+        needed. Threads needing a token while another one refreshes it wait for its result
+
+        Raises:
+            FCMTimeoutError: the deadline expired waiting for another thread's refresh
+        """
+        deadline = getattr(self.thread_local, "token_deadline", None)
+        if not self._token_lock.acquire(
+            timeout=deadline.remaining() if deadline is not None else -1
         ):
-            sleep_time = int(response.headers["Retry-After"])
-            time.sleep(sleep_time)
-            return self.send_request(payload, timeout)
+            raise FCMTimeoutError("Deadline exceeded waiting for the token refresh")
+        try:
+            current_timestamp = time.time()
+            if self._token_expiry < current_timestamp:
+                with stage(self.profiler, "token_refresh"):
+                    self._token_headers = self.request_headers(
+                        timeout=deadline.remaining() if deadline is not None else None
+                    )
+                self._token_expiry = current_timestamp + 1800
+            return self._token_headers, self._token_expiry
+        finally:
+            self._token_lock.release()
+
+    def _expire_token(self):
+        """
+        Forces a refresh before the next request, unless another thread already replaced
+        the token this thread was using
+        """
+        with self._token_lock:
+            if self._token_expiry <= self.thread_local.token_expiry:
+                self._token_expiry = 0
+        self.thread_local.token_expiry = 0
 
-        if self._is_access_token_expired(response):
-            self.thread_local.token_expiry = 0
-            return self.send_request(payload, timeout)
+    def send_request(
+        self,
+        payload=None,
+        timeout=None,
+        deadline=None,
+        priority=PRIORITY_NORMAL,
+        tenant=None,
+    ):
+        """
+        Sends the payload, sleeping on Retry-After, retrying 502/503 responses and connection
+        errors with exponential backoff, and refreshing expired tokens as needed. Every retry
+        counts toward MAX_RETRIES, after which the last response is returned
+
+        Args:
+            payload (bytes): serialized message
+            timeout (float or Timeout, optional): time limit of each HTTP exchange
+            deadline (Deadline or float, optional): overall time limit, covering token refresh,
+                Retry-After sleeps and retries. Defaults to `timeout.total` if set
+            priority (str, optional): scheduler lane, one of "high", "normal" or "bulk"
+            tenant (optional): scheduler tenant the request is accounted to
+
+        Raises:
+            FCMTimeoutError: the deadline expired before the message could be sent
+        """
+        deadline = resolve_deadline(timeout, deadline)
+        retries = 0
+        while True:
+            try:
+                response = self._post(payload, timeout, deadline, priority, tenant)
+            except requests.exceptions.ConnectionError:
+                if retries >= MAX_RETRIES:
+                    raise
+                self._backoff(retries, deadline)
+                retries += 1
+                continue
+            if response is None or retries >= MAX_RETRIES:
+                return response
+
+            if (
+                "Retry-After" in response.headers
+                and int(response.headers["Retry-After"]) > 0
+            ):
+                sleep_time = int(response.headers["Retry-After"])
+                if deadline is not None and sleep_time >= deadline.remaining():
+                    raise FCMTimeoutError(
+                        f"FCM asked to retry after {sleep_time}s, past the deadline"
+                    )
+                with stage(self.profiler, "retry_after"):
+                    time.sleep(sleep_time)
+            elif response.status_code in RETRY_STATUS_CODES:
+                self._backoff(retries, deadline)
+            elif self._is_access_token_expired(response):
+                self._expire_token()
+            else:
+                return response
+            retries += 1
+
+    def _backoff(self, retries, deadline):
+        """
+        Sleeps before retry number `retries` + 1: not before the first, then 2, 4, 8... seconds
+
+        Raises:
+            FCMTimeoutError: the sleep would end past the deadline
+        """
+        sleep_time = (
+            min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_FACTOR * 2**retries) if retries else 0
+        )
+        if deadline is not None and sleep_time >= deadline.remaining():
+            raise FCMTimeoutError(
+                f"Retrying in {sleep_time}s would go past the deadline"
+            )
+        if sleep_time:
+            with stage(self.profiler, "retry_backoff"):
+                time.sleep(sleep_time)
+
+    def _post(
+        self, payload, timeout, deadline=None, priority=PRIORITY_NORMAL, tenant=None
+    ):
+        """
+        Single POST to the FCM endpoint, guarded by the circuit breaker and admitted by the
+        scheduler or the concurrency limiter if set.
+        The breaker is checked first so an open circuit fails fast without a token refresh,
+        then the session is fetched so token refreshes do not hold a slot.
 
+        Returns:
+            Response, or None if the circuit breaker handed the payload to its `on_reject` callback
+        """
+        breaker = self.circuit_breaker
+        if breaker is not None and not breaker.allow_request():
+            return self._reject_request(payload)
+        try:
+            session = self._session(deadline)
+        except Exception:
+            # nothing was sent, give back a half-open trial permit
+            if breaker is not None:
+                breaker.cancel()
+            raise
+
+        try:
+            with stage(self.profiler, "admission"):
+                admission_timeout = (
+                    deadline.remaining() if deadline is not None else None
+                )
+                if self.scheduler is not None:
+                    gate = self.scheduler
+                    gate.acquire(priority, tenant, timeout=admission_timeout)
+                else:
+                    gate = self.concurrency_limiter
+                    if gate is not None:
+                        gate.acquire(timeout=admission_timeout)
+        except FCMTimeoutError:
+            self._abandon_request(None)
+            raise
+        started = time.monotonic()
+        try:
+            if deadline is not None:
+                deadline.check("sending the request")
+            with stage(self.profiler, "http"):
+                response = session.post(
+                    self.fcm_end_point,
+                    data=payload,
+                    timeout=requests_timeout(timeout, deadline),
+                )
+        except FCMTimeoutError:
+            self._abandon_request(gate)
+            raise
+        except requests.exceptions.RequestException:
+            self._record_outcome(gate, started, None)
+            raise
+        self._record_outcome(gate, started, response.status_code)
         return response
 
-    def send_async_request(self, params_list, timeout):
-        import asyncio
-        from .async_fcm import fetch_tasks
-
-        payloads = [self.parse_payload(**params) for params in params_list]
-        responses = asyncio.new_event_loop().run_until_complete(
-            fetch_tasks(
-                end_point=self.fcm_end_point,
-                headers=self.request_headers(),
-                payloads=payloads,
-                timeout=timeout,
+    def _session(self, deadline=None):
+        """
+        The session of the calling thread, with the token refresh bounded by the deadline
+        """
+        if deadline is None:
+            return self.requests_session
+        deadline.check("token refresh")
+        self.thread_local.token_deadline = deadline
+        try:
+            return self.requests_session
+        finally:
+            self.thread_local.token_deadline = None
+
+    def warmup(self, connections=10, timeout=10):
+        """
+        Prepares the client so the first messages are as fast as the following ones:
+        resolves the FCM host, fetches the access token shared by all threads and opens
+        `connections` keep-alive connections (TCP and TLS handshakes included) in the
+        shared pool, from at most WARMUP_MAX_THREADS threads.
+
+        The async path cannot reuse this pool: every async batch runs in its own event
+        loop and client session, so it opens the same number of connections again before
+        its first send. For async batches the warmup is a per-batch, up-front cost.
+
+        Args:
+            connections (int): number of connections to open, 0 to only resolve the host
+                and fetch the token
+            timeout (float): time limit of each connection attempt
+
+        Returns:
+            int: number of connections opened
+        """
+        url = urlsplit(self.fcm_end_point)
+        port = url.port or (443 if url.scheme == "https" else 80)
+        socket.getaddrinfo(url.hostname, port, type=socket.SOCK_STREAM)
+
+        session = self.requests_session
+        if connections <= 0:
+            self._warm_connections = 0
+            return 0
+        if connections > self.pool_maxsize and self.custom_adapter is None:
+            self.pool_maxsize = connections
+            adapter, self._adapter = self._adapter, None
+            session = self.requests_session
+            if adapter is not None:
+                # the sessions of other threads move to the new adapter on their next request
+                adapter.close()
+        self._warm_connections = connections
+
+        root = f"{url.scheme}://{url.netloc}/"
+        proxies = dict(session.proxies)
+        threads = min(connections, WARMUP_MAX_THREADS)
+        shares = [
+            connections // threads + (1 if i < connections % threads else 0)
+            for i in range(threads)
+        ]
+        # every request holds its connection until all of them are open, so none is reused
+        all_open = threading.Barrier(threads)
+
+        def connect(share):
+            # a throwaway session per thread. It is not closed, closing it
+            # would also close the shared adapter and its pool
+            warmup_session = requests.Session()
+            warmup_session.mount("http://", self.adapter)
+            warmup_session.mount("https://", self.adapter)
+            warmup_session.proxies.update(proxies)
+            responses = []
+            for _ in range(share):
+                try:
+                    responses.append(
+                        warmup_session.head(root, timeout=timeout, stream=True)
+                    )
+                except requests.exceptions.RequestException:
+                    pass
+            try:
+                all_open.wait(timeout * share)
+            except threading.BrokenBarrierError:
+                pass
+            for response in responses:
+                # reading the (empty) body hands the connection back to the pool open
+                response.content
+            return len(responses)
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return sum(executor.map(connect, shares))
+
+    def _record_outcome(self, gate, started, status_code):
+        if gate is not None:
+            gate.release(
+                time.monotonic() - started, status_code, dropped=status_code is None
             )
-        )
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record(status_code)
+
+    def _abandon_request(self, gate):
+        # nothing was sent, so there is no outcome to learn from
+        if gate is not None:
+            gate.release()
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.cancel()
+
+    def _reject_request(self, payload):
+        on_reject = self.circuit_breaker.on_reject
+        if on_reject is None:
+            raise FCMCircuitOpenError(
+                "FCM circuit breaker is open, the request was not sent"
+            )
+        on_reject(payload)
+        return None
+
+    def send_async_request(
+        self,
+        params_list,
+        timeout,
+        deadline=None,
+        priority=PRIORITY_NORMAL,
+        tenant=None,
+        concurrency=None,
+        sink=None,
+    ):
+        import asyncio
+        from .async_fcm import DEFAULT_CONCURRENCY, fetch_tasks
+
+        # Timeout.total is the budget of the whole call, as for send_request
+        deadline = resolve_deadline(timeout, deadline)
+        try:
+            with stage(self.profiler, "async_batch"):
+                # reuse the token shared by all threads, fetched ahead of time by warmup
+                authorization = self._session(deadline).headers["Authorization"]
+                # messages are serialized by the workers just before they are sent
+                loop = asyncio.new_event_loop()
+                try:
+                    responses = loop.run_until_complete(
+                        fetch_tasks(
+                            end_point=self.fcm_end_point,
+                            headers={
+                                "Content-Type": "application/json",
+                                "Authorization": authorization,
+                            },
+                            payloads=params_list,
+                            serialize=self._serialize_params,
+                            concurrency=concurrency or DEFAULT_CONCURRENCY,
+                            timeout=timeout,
+                            limiter=self.concurrency_limiter,
+                            breaker=self.circuit_breaker,
+                            deadline=deadline,
+                            scheduler=self.scheduler,
+                            priority=priority,
+                            tenant=tenant,
+                            lean=self.lean_responses,
+                            warmup=self._warm_connections,
+                            sink=sink,
+                            profiler=self.profiler,
+                        )
+                    )
+                finally:
+                    loop.run_until_complete(loop.shutdown_default_executor())
+                    loop.close()
+        finally:
+            if self.profiler is not None:
+                # also when the batch fails, each dump covers the stages timed since the last one
+                self.profiler.dump(reset=True)
 
         return responses
 
+    def _serialize_params(self, params):
+        with stage(self.profiler, "parse_payload"):
+            return self.parse_payload(**params)
+
     def _is_access_token_expired(self, response):
         """
         Check if the response indicates an expired access token
@@ -161,6 +526,9 @@ class BaseAPI(object):
         if response.status_code != 401:
             return False
 
+        if self.lean_responses:
+            return b"ACCESS_TOKEN_EXPIRED" in response.content
+
         try:
             error_response = response.json()
             error_details = error_response.get("error", {}).get("details", [])
@@ -187,10 +555,14 @@ class BaseAPI(object):
             )
             self._service_account_file = None
 
-    def _get_access_token(self):
+    def _get_access_token(self, timeout=None):
         """
         Generates access token from credentials.
         If token expires then new access token is generated.
+
+        Args:
+            timeout (float, optional): time limit for the token request
+
         Returns:
              str: Access token
         """
@@ -200,21 +572,26 @@ class BaseAPI(object):
         # get OAuth 2.0 access token
         try:
             request = google.auth.transport.requests.Request()
+            if timeout is not None:
+                request = functools.partial(request, timeout=timeout)
             self.credentials.refresh(request)
             return self.credentials.token
         except Exception as e:
             raise InvalidDataError(e)
 
-    def request_headers(self):
+    def request_headers(self, timeout=None):
         """
         Generates request headers including Content-Type and Authorization of Bearer token
 
+        Args:
+            timeout (float, optional): time limit for the token request
+
         Returns:
             dict: request headers
         """
         return {
             "Content-Type": "application/json",
-            "Authorization": "Bearer " + self._get_access_token(),
+            "Authorization": "Bearer " + self._get_access_token(timeout),
         }
 
     def json_dumps(self, data):
@@ -241,6 +618,7 @@ class BaseAPI(object):
 
         Returns:
             dict: name (str) - The identifier of the message sent, in the format of projects/*/messages/{message_id}
+            str: the identifier alone, with `lean_responses`
 
         Raises:
             FCMServerError: FCM is temporary not available
@@ -257,26 +635,42 @@ class BaseAPI(object):
                 raise FCMServerError(
                     "FCM server connection error, the response is empty"
                 )
+            elif self.lean_responses:
+                return extract_name(response.content)
             else:
                 return response.json()
 
         elif response.status_code == 401:
-            raise AuthenticationError(
+            error = AuthenticationError(
                 "There was an error authenticating the sender account"
             )
         elif response.status_code == 400:
-            raise InvalidDataError(response.text)
+            error = InvalidDataError(response.text)
         elif response.status_code == 403:
-            raise FCMSenderIdMismatchError(
+            error = FCMSenderIdMismatchError(
                 "The authenticated sender ID is different from the sender ID for the registration token."
             )
         elif response.status_code == 404:
-            raise FCMNotRegisteredError("Token not registered")
+            error = FCMNotRegisteredError("Token not registered")
         else:
-            raise FCMServerError(
+            error = FCMServerError(
                 f"FCM server error: Unexpected status code {response.status_code}. "
                 "The server might be temporarily unavailable."
             )
+        error.error_code = self._error_code(response) or error.error_code
+        raise error
+
+    def _error_code(self, response):
+        """
+        Returns:
+            str: FCM error code of an error response, e.g. UNREGISTERED, or its status if the
+                body carries no error code. None if the body cannot be read
+        """
+        try:
+            error = extract_error(response.status_code, response.content)["error"]
+        except (TypeError, ValueError):
+            return None
+        return error["errorCode"] or error["status"]
 
     def parse_payload(  # noqa: C901
         self,
@@ -352,4 +746,5 @@ class BaseAPI(object):
         if data_payload and (not notification_title and not notification_body):
             del fcm_payload["notification"]
 
-        return self.json_dumps({"message": fcm_payload, "validate_only": dry_run})
+        with stage(self.profiler, "json_dumps"):
+            return self.json_dumps({"message": fcm_payload, "validate_only": dry_run})
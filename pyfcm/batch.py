@@ -0,0 +1,136 @@
+from array import array
+
+
+class MessageBatch(object):
+    """
+    Compact container for large personalized batches.
+
+    Messages are stored column-wise: tokens are packed into a single byte
+    buffer indexed by offsets, every message refers to a shared template by
+    number, and the fields that differ from the template are kept as a tuple
+    of values whose keys are shared by all messages personalized the same way.
+    Iterating yields the `notify` keyword arguments of each message, built on
+    the fly, so a batch can be handed to `async_notify_multiple_devices` in
+    place of a list of dicts and is serialized one message at a time as the
+    sender consumes it.
+    """
+
+    def __init__(self, **template):
+        """
+        Attributes:
+            template: optional keyword arguments of `notify` shared by the messages added
+                without an explicit template, registered as template 0
+        """
+        self._templates = []
+        self._tokens = bytearray()
+        self._offsets = array("Q", [0])
+        self._template_ids = array("I")
+        # per message: index into _schemas (-1 without overrides) and the override values
+        self._schema_ids = array("i")
+        self._values = []
+        self._schemas = []
+        self._schema_ids_by_keys = {}
+        self.add_template(**template)
+
+    def add_template(self, **params):
+        """
+        Registers keyword arguments of `notify` shared by many messages
+
+        Returns:
+            int: template number to pass to `add`
+        """
+        if "fcm_token" in params:
+            raise ValueError("Templates cannot carry a fcm_token")
+        self._templates.append(params)
+        return len(self._templates) - 1
+
+    def add(self, fcm_token, template=0, **overrides):
+        """
+        Adds a message
+
+        Args:
+            fcm_token (str): FCM device registration ID
+            template (int, optional): template the message is based on
+            overrides: keyword arguments of `notify` specific to this message. A `data_payload`
+                is merged into the template's one
+        """
+        if not 0 <= template < len(self._templates):
+            raise IndexError(f"Unknown template {template}")
+
+        if overrides:
+            keys, values = self._flatten(overrides)
+            schema_id = self._schema_ids_by_keys.get(keys)
+            if schema_id is None:
+                schema_id = self._schema_ids_by_keys[keys] = len(self._schemas)
+                self._schemas.append(keys)
+            self._schema_ids.append(schema_id)
+            self._values.append(values)
+        else:
+            self._schema_ids.append(-1)
+            self._values.append(None)
+
+        self._tokens += fcm_token.encode("ascii")
+        self._offsets.append(len(self._tokens))
+        self._template_ids.append(template)
+
+    def extend(self, fcm_tokens, template=0):
+        """
+        Adds one message per token, all built from the same template
+        """
+        for fcm_token in fcm_tokens:
+            self.add(fcm_token, template)
+
+    def token(self, index):
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return self._tokens[start:end].decode("ascii")
+
+    def params(self, index):
+        """
+        Returns:
+            dict: keyword arguments of `notify` for the message at `index`
+        """
+        params = dict(self._templates[self._template_ids[index]])
+        params["fcm_token"] = self.token(index)
+        schema_id = self._schema_ids[index]
+        if schema_id < 0:
+            return params
+
+        data_payload = None
+        for (key, data_key), value in zip(
+            self._schemas[schema_id], self._values[index]
+        ):
+            if data_key is None:
+                params[key] = value
+                continue
+            if data_payload is None:
+                data_payload = dict(params.get("data_payload") or {})
+                params["data_payload"] = data_payload
+            data_payload[data_key] = value
+        return params
+
+    def __len__(self):
+        return len(self._template_ids)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("MessageBatch index out of range")
+        return self.params(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.params(index)
+
+    @staticmethod
+    def _flatten(overrides):
+        items = []
+        for key, value in overrides.items():
+            if key == "data_payload" and isinstance(value, dict):
+                items.extend(
+                    ((key, data_key), item) for data_key, item in value.items()
+                )
+            else:
+                items.append(((key, None), value))
+        items.sort(key=lambda item: (item[0][0], item[0][1] or ""))
+        return tuple(key for key, _ in items), tuple(value for _, value in items)
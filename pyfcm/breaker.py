@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import deque
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker guarding the FCM endpoint.
+
+    While closed, the outcome of every request is kept in a rolling window.
+    Once the share of server errors, timeouts and connection failures in that
+    window reaches `failure_rate_threshold` the breaker opens, and requests are
+    rejected without touching the network. After `reset_timeout` seconds it
+    lets `half_open_max_calls` trial requests through: if they all succeed the
+    breaker closes again, a single failure opens it for another period.
+
+    The same instance is thread safe and can be shared by the sync and async paths.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_rate_threshold=0.5,
+        window_size=50,
+        minimum_calls=10,
+        reset_timeout=30,
+        half_open_max_calls=1,
+        on_reject=None,
+    ):
+        """
+        Attributes:
+            failure_rate_threshold (float): share of failed requests that opens the breaker
+            window_size (int): number of recent requests the failure rate is computed over
+            minimum_calls (int): the breaker never opens before that many requests were seen
+            reset_timeout (float): seconds the breaker stays open before probing
+            half_open_max_calls (int): trial requests that must succeed to close the breaker
+            on_reject (callable, optional): receives the payload of every rejected request,
+                e.g. to defer it to a queue. Without it rejected requests raise FCMCircuitOpenError
+        """
+        if not 0 < failure_rate_threshold <= 1:
+            raise ValueError("failure_rate_threshold must be between 0 and 1")
+
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = min(minimum_calls, window_size)
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.on_reject = on_reject
+
+        self._outcomes = deque(maxlen=window_size)
+        self._failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_successes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            self._check_reset_timeout()
+            return self._state
+
+    @property
+    def failure_rate(self):
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._failures / len(self._outcomes)
+
+    def allow_request(self):
+        """
+        Returns:
+            bool: True if the request may be sent. The caller must then report its outcome with `record`
+        """
+        with self._lock:
+            self._check_reset_timeout()
+            if self._state == self.CLOSED:
+                return True
+            if (
+                self._state == self.HALF_OPEN
+                and self._trials < self.half_open_max_calls
+            ):
+                self._trials += 1
+                return True
+            return False
+
+    def record(self, status_code=None):
+        """
+        Report the outcome of a request let through by `allow_request`
+
+        Args:
+            status_code (int, optional): HTTP status of the response, None if it timed out or failed to connect
+        """
+        failed = status_code is None or status_code >= 500
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.half_open_max_calls:
+                        self._close()
+                return
+            if self._state == self.OPEN:
+                return
+
+            if len(self._outcomes) == self._outcomes.maxlen and self._outcomes[0]:
+                self._failures -= 1
+            self._outcomes.append(failed)
+            self._failures += failed
+            if (
+                len(self._outcomes) >= self.minimum_calls
+                and self._failures / len(self._outcomes) >= self.failure_rate_threshold
+            ):
+                self._open()
+
+    def cancel(self):
+        """
+        Report that a request let through by `allow_request` was abandoned before being sent
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def _check_reset_timeout(self):
+        if (
+            self._state == self.OPEN
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = self.HALF_OPEN
+            self._trials = 0
+            self._trial_successes = 0
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+
+    def _close(self):
+        self._state = self.CLOSED
+        self._outcomes.clear()
+        self._failures = 0
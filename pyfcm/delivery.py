@@ -0,0 +1,253 @@
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import requests
+
+from pyfcm.priority import PRIORITY_BULK
+from pyfcm.sinks import make_record
+
+# Fractional part of the golden ratio, successive multiples of it fill [0, 1) evenly
+_GOLDEN_RATIO = 0.6180339887498949
+
+
+def next_local_time(at, tz, now=None):
+    """
+    Next occurrence of a wall clock time in a time zone, e.g. the next 9am for a user
+
+    Args:
+        at (datetime.time): local time of day
+        tz (str or tzinfo): IANA time zone name such as "Europe/Paris", or a tzinfo
+        now (datetime, optional): aware reference time, the current time by default
+
+    Returns:
+        datetime: aware datetime in `tz`
+    """
+    zone = ZoneInfo(tz) if isinstance(tz, str) else tz
+    now = (now or datetime.now(zone)).astimezone(zone)
+    candidate = datetime.combine(now.date(), at, tzinfo=zone)
+    if candidate <= now:
+        candidate = datetime.combine(now.date() + timedelta(days=1), at, tzinfo=zone)
+    return candidate
+
+
+class DeliveryScheduler(object):
+    """
+    Holds messages until their send-at time, then sends them through the client.
+
+    Messages are kept in a heap ordered by release time. Messages due at the
+    same instant form a bucket, spread over the following `window` seconds:
+    the n-th message of a bucket is released at the fraction n * 0.618... of
+    the window (modulo 1), so a bucket is spread evenly however many messages
+    it ends up with. Released messages are sent with `notify` by a pool of
+    `workers` threads, admitted by the client's PriorityScheduler or
+    concurrency limiter if it has one. When all workers are busy, messages
+    stay in the heap.
+
+    Usage:
+        with DeliveryScheduler(fcm, window=600) as delivery:
+            for user in users:
+                delivery.schedule(next_local_time(time(9), user.tz), fcm_token=user.fcm_token, ...)
+            delivery.join()
+    """
+
+    def __init__(
+        self,
+        fcm,
+        window=300,
+        workers=10,
+        priority=PRIORITY_BULK,
+        tenant=None,
+        sink=None,
+    ):
+        """
+        Attributes:
+            fcm (FCMNotification): client the messages are sent with
+            window (float): seconds each bucket of messages due at the same time is spread over
+            workers (int): messages sent concurrently
+            priority (str): scheduler lane of the messages, unless their parameters set one
+            tenant (optional): scheduler tenant of the messages, unless their parameters set one
+            sink (ResultSink, optional): sink the outcome of every message is written to, indexed
+                by the id returned by `schedule`, with FCM error codes such as UNREGISTERED
+
+        Counters `sent`, `failed` and `deferred` (handed to the circuit breaker's `on_reject`)
+        are updated as messages complete.
+        """
+        self.fcm = fcm
+        self.window = window
+        self.workers = workers
+        self.priority = priority
+        self.tenant = tenant
+        self.sink = sink
+        self.sent = 0
+        self.failed = 0
+        self.deferred = 0
+
+        self._heap = []
+        # send-at time -> [messages scheduled for it so far, messages not released yet]
+        self._buckets = {}
+        self._ids = 0
+        self._in_flight = 0
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._slots = threading.Semaphore(workers)
+        self._executor = None
+        self._thread = None
+
+    @property
+    def pending(self):
+        """
+        Number of messages not released yet
+        """
+        return len(self._heap)
+
+    def schedule(self, send_at, tz=None, **params):
+        """
+        Schedules a message
+
+        Args:
+            send_at (datetime or float): when to send the message, as an aware datetime, a naive
+                datetime in `tz` (or in the local time zone without `tz`), or a POSIX timestamp
+            tz (str or tzinfo, optional): time zone of a naive `send_at`
+            params: keyword arguments of `notify`
+
+        Returns:
+            int: id of the message, its index in the records written to the sink
+        """
+        send_at = self._timestamp(send_at, tz)
+        with self._condition:
+            message_id = self._ids
+            self._ids += 1
+            bucket = self._buckets.setdefault(send_at, [0, 0])
+            offset = (bucket[0] * _GOLDEN_RATIO) % 1.0 * self.window
+            bucket[0] += 1
+            bucket[1] += 1
+            heapq.heappush(self._heap, (send_at + offset, message_id, send_at, params))
+            if self._heap[0][1] == message_id:
+                self._condition.notify_all()
+        return message_id
+
+    def start(self):
+        """
+        Starts releasing messages as they become due
+        """
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout=None):
+        """
+        Blocks until every scheduled message is sent
+
+        Returns:
+            bool: False if `timeout` expired first
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._heap and not self._in_flight, timeout
+            )
+
+    def stop(self):
+        """
+        Stops releasing messages and waits for those being sent
+
+        Returns:
+            list: (send-at timestamp, notify keyword arguments) of the messages not released, in
+                release order, to be scheduled again later
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._executor.shutdown(wait=True)
+            self._thread = None
+        with self._condition:
+            remaining = [
+                (send_at, params) for _, _, send_at, params in sorted(self._heap)
+            ]
+            self._heap = []
+            self._buckets = {}
+        return remaining
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @staticmethod
+    def _timestamp(send_at, tz):
+        if not isinstance(send_at, datetime):
+            return float(send_at)
+        if send_at.tzinfo is None and tz is not None:
+            send_at = send_at.replace(
+                tzinfo=ZoneInfo(tz) if isinstance(tz, str) else tz
+            )
+        return send_at.timestamp()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    delay = self._heap[0][0] - time.time() if self._heap else None
+                    if delay is not None and delay <= 0:
+                        break
+                    self._condition.wait(delay)
+                if self._stopped:
+                    return
+                _, message_id, send_at, params = heapq.heappop(self._heap)
+                bucket = self._buckets[send_at]
+                bucket[1] -= 1
+                if not bucket[1]:
+                    del self._buckets[send_at]
+                self._in_flight += 1
+            # wait for a free worker, the messages due meanwhile stay in the heap
+            self._slots.acquire()
+            self._executor.submit(self._send, message_id, params)
+
+    def _send(self, message_id, params):
+        kwargs = {"priority": self.priority, "tenant": self.tenant}
+        kwargs.update(params)
+        error = None
+        try:
+            result = self.fcm.notify(**kwargs)
+        except Exception as e:
+            result = None
+            error = self._error_code(e)
+        try:
+            if self.sink is not None:
+                record = make_record(message_id, params, result)
+                if error is not None:
+                    record["error"] = error
+                self.sink.put(record)
+        finally:
+            self._slots.release()
+            with self._condition:
+                self._in_flight -= 1
+                if error is not None:
+                    self.failed += 1
+                elif result is None:
+                    # handed to the circuit breaker's on_reject callback, not sent
+                    self.deferred += 1
+                else:
+                    self.sent += 1
+                self._condition.notify_all()
+
+    @staticmethod
+    def _error_code(exception):
+        """
+        Returns:
+            str: FCM error code for a failed `notify`, the same vocabulary as the async batch records
+        """
+        error_code = getattr(exception, "error_code", None)
+        if error_code is not None:
+            return error_code
+        if isinstance(exception, requests.exceptions.RequestException):
+            return "UNAVAILABLE"
+        return "UNSPECIFIED_ERROR"
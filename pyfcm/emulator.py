@@ -0,0 +1,297 @@
+"""
+Local stand-in for the FCM HTTP v1 API and the Google OAuth token endpoint.
+
+The emulator serves `POST /v1/projects/{project}/messages:send` and
+`POST /token` from a background thread, so the client's retries, throttling
+and token refresh can be exercised, and its throughput measured, without a
+Firebase project:
+
+    with FCMEmulator(unregistered_tokens={"stale"}, quota=1000) as emulator:
+        fcm = emulator.client()
+        fcm.notify(fcm_token="device", notification_title="Hi")
+
+Errors follow the layout of the real service, with the FCM error code in the
+details for 4xx send errors and ACCESS_TOKEN_EXPIRED as reason for expired tokens.
+"""
+
+import asyncio
+import itertools
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from aiohttp import web
+from google.oauth2.credentials import Credentials
+
+_FCM_ERROR_TYPE = "type.googleapis.com/google.firebase.fcm.v1.FcmError"
+_ERROR_INFO_TYPE = "type.googleapis.com/google.rpc.ErrorInfo"
+
+
+def uniform_latency(low, high, seed=None):
+    """
+    Returns:
+        callable: latency sampler drawing seconds uniformly between `low` and `high`
+    """
+    rng = random.Random(seed)
+    return lambda: rng.uniform(low, high)
+
+
+def lognormal_latency(median, sigma=0.5, seed=None):
+    """
+    Long-tailed latencies, closer to what a real network shows than a uniform draw
+
+    Returns:
+        callable: latency sampler drawing seconds from a log-normal distribution around `median`
+    """
+    rng = random.Random(seed)
+    mu = math.log(median)
+    return lambda: rng.lognormvariate(mu, sigma)
+
+
+class FCMEmulator(object):
+    """
+    Emulated FCM v1 endpoint, run in a background thread with its own event loop.
+    """
+
+    def __init__(
+        self,
+        project_id="emulator",
+        latency=None,
+        quota=None,
+        quota_window=60,
+        unregistered_tokens=(),
+        token_lifetime=3600,
+        host="127.0.0.1",
+        port=0,
+    ):
+        """
+        Attributes:
+            project_id (str): project ID of the messages names, any project is accepted in the URL
+            latency (float or callable, optional): seconds before each message is answered, or a
+                sampler such as `lognormal_latency(0.05)` called for each message
+            quota (int, optional): messages accepted per `quota_window`, the others get a 429
+                with a Retry-After up to the end of the window. Unlimited if None
+            quota_window (float): length in seconds of the quota window
+            unregistered_tokens (iterable): device tokens answered with a 404 UNREGISTERED error
+            token_lifetime (float): seconds an access token is accepted for, after which
+                messages sent with it get a 401 ACCESS_TOKEN_EXPIRED error
+            host (str): interface to listen on
+            port (int): port to listen on, a free one is picked if 0
+        """
+        self.project_id = project_id
+        self.latency = latency
+        self.quota = quota
+        self.quota_window = quota_window
+        self.unregistered_tokens = set(unregistered_tokens)
+        self.token_lifetime = token_lifetime
+        self.host = host
+        self.port = port
+        self.stats = Counter()
+
+        self._tokens = {}
+        self._token_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._window_started = time.monotonic()
+        self._window_count = 0
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def end_point_base(self):
+        """
+        Replacement for BaseAPI.FCM_END_POINT_BASE
+        """
+        return f"{self.url}/v1/projects"
+
+    @property
+    def token_uri(self):
+        return f"{self.url}/token"
+
+    def credentials(self):
+        """
+        Returns:
+            Credentials: OAuth credentials fetching their access tokens from the emulator
+        """
+        return Credentials(
+            token=None,
+            refresh_token="emulator",
+            token_uri=self.token_uri,
+            client_id="emulator",
+            client_secret="emulator",
+        )
+
+    def client(self, **kwargs):
+        """
+        Returns:
+            FCMNotification: client sending to the emulator, built with `kwargs`
+        """
+        from pyfcm import FCMNotification
+
+        fcm = FCMNotification(
+            credentials=self.credentials(), project_id=self.project_id, **kwargs
+        )
+        fcm.FCM_END_POINT_BASE = self.end_point_base
+        return fcm
+
+    def expire_tokens(self):
+        """
+        Expires every access token issued so far
+        """
+        # a snapshot, the server thread may issue tokens meanwhile
+        for token in list(self._tokens):
+            self._tokens[token] = 0
+
+    def start(self):
+        """
+        Starts serving, returns once the server listens
+        """
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._serve, args=(started,), daemon=True
+        )
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def application(self):
+        """
+        Returns:
+            web.Application: the emulator's routes, to be served by any aiohttp runner
+        """
+        app = web.Application()
+        app.router.add_post("/token", self._issue_token)
+        app.router.add_post("/v1/projects/{project}/messages:send", self._send)
+        app.router.add_route("HEAD", "/", self._head)
+        return app
+
+    def _serve(self, started):
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.application())
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = self._runner.addresses[0][1]
+        started.set()
+        self._loop.run_forever()
+
+    async def _head(self, request):
+        return web.Response()
+
+    async def _issue_token(self, request):
+        token = f"emulator-token-{next(self._token_ids)}"
+        self._tokens[token] = time.monotonic() + self.token_lifetime
+        self.stats["tokens"] += 1
+        return web.json_response(
+            {
+                "access_token": token,
+                "expires_in": self.token_lifetime,
+                "token_type": "Bearer",
+            }
+        )
+
+    async def _send(self, request):
+        if self.latency is not None:
+            latency = self.latency() if callable(self.latency) else self.latency
+            await asyncio.sleep(latency)
+
+        authorization = request.headers.get("Authorization", "")
+        expiry = self._tokens.get(authorization[len("Bearer ") :])
+        if expiry is None:
+            return self._error(401, "UNAUTHENTICATED", "unauthenticated")
+        if expiry < time.monotonic():
+            return self._error(
+                401, "UNAUTHENTICATED", "expired", reason="ACCESS_TOKEN_EXPIRED"
+            )
+
+        retry_after = self._consume_quota()
+        if retry_after is not None:
+            response = self._error(
+                429, "RESOURCE_EXHAUSTED", "throttled", error_code="QUOTA_EXCEEDED"
+            )
+            response.headers["Retry-After"] = str(retry_after)
+            return response
+
+        try:
+            message = (await request.json())["message"]
+            targets = [key for key in ("token", "topic", "condition") if key in message]
+        except (ValueError, KeyError, TypeError):
+            targets = None
+        if not targets or len(targets) != 1:
+            return self._error(
+                400, "INVALID_ARGUMENT", "invalid", error_code="INVALID_ARGUMENT"
+            )
+
+        if message.get("token") in self.unregistered_tokens:
+            return self._error(
+                404, "NOT_FOUND", "unregistered", error_code="UNREGISTERED"
+            )
+
+        self.stats["sent"] += 1
+        project = request.match_info["project"]
+        return web.json_response(
+            {"name": f"projects/{project}/messages/{next(self._message_ids)}"}
+        )
+
+    def _consume_quota(self):
+        """
+        Returns:
+            int: seconds to wait if the quota of the current window is used up, None otherwise
+        """
+        if self.quota is None:
+            return None
+        now = time.monotonic()
+        if now - self._window_started >= self.quota_window:
+            self._window_started = now
+            self._window_count = 0
+        if self._window_count >= self.quota:
+            return max(1, math.ceil(self._window_started + self.quota_window - now))
+        self._window_count += 1
+        return None
+
+    def _error(self, code, status, stat, error_code=None, reason=None):
+        self.stats[stat] += 1
+        details = []
+        if error_code is not None:
+            details.append({"@type": _FCM_ERROR_TYPE, "errorCode": error_code})
+        if reason is not None:
+            details.append(
+                {
+                    "@type": _ERROR_INFO_TYPE,
+                    "reason": reason,
+                    "domain": "googleapis.com",
+                }
+            )
+        return web.json_response(
+            {
+                "error": {
+                    "code": code,
+                    "message": f"Emulated {status} error",
+                    "status": status,
+                    "details": details,
+                }
+            },
+            status=code,
+        )
@@ -1,9 +1,13 @@
 class FCMError(Exception):
     """
     PyFCM Error
+
+    Attributes:
+        error_code (str): FCM error code of the failure, e.g. UNREGISTERED, as found in the
+            response body when there is one
     """
 
-    pass
+    error_code = None
 
 
 class AuthenticationError(FCMError):
@@ -11,7 +15,7 @@ class AuthenticationError(FCMError):
     API key not found or there was an error authenticating the sender
     """
 
-    pass
+    error_code = "UNAUTHENTICATED"
 
 
 class FCMNotRegisteredError(FCMError):
@@ -20,7 +24,7 @@ class FCMNotRegisteredError(FCMError):
     https://firebase.google.com/docs/reference/fcm/rest/v1/ErrorCode
     """
 
-    pass
+    error_code = "UNREGISTERED"
 
 
 class FCMSenderIdMismatchError(FCMError):
@@ -29,7 +33,7 @@ class FCMSenderIdMismatchError(FCMError):
     https://firebase.google.com/docs/reference/fcm/rest/v1/ErrorCode
     """
 
-    pass
+    error_code = "SENDER_ID_MISMATCH"
 
 
 class FCMServerError(FCMError):
@@ -37,7 +41,23 @@ class FCMServerError(FCMError):
     Internal server error or timeout error on Firebase cloud messaging server
     """
 
-    pass
+    error_code = "INTERNAL"
+
+
+class FCMCircuitOpenError(FCMServerError):
+    """
+    Request was not sent because the circuit breaker around the FCM endpoint is open
+    """
+
+    error_code = "UNAVAILABLE"
+
+
+class FCMTimeoutError(FCMError):
+    """
+    The deadline of the call expired before it could be completed
+    """
+
+    error_code = "DEADLINE_EXCEEDED"
 
 
 class InvalidDataError(FCMError):
@@ -45,7 +65,7 @@ class InvalidDataError(FCMError):
     Invalid input
     """
 
-    pass
+    error_code = "INVALID_ARGUMENT"
 
 
 class InternalPackageError(FCMError):
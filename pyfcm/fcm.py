@@ -1,4 +1,6 @@
 from .baseapi import BaseAPI
+from .priority import PRIORITY_NORMAL
+from .profiling import stage
 
 
 class FCMNotification(BaseAPI):
@@ -17,6 +19,9 @@ class FCMNotification(BaseAPI):
         fcm_options=None,
         dry_run=False,
         timeout=120,
+        deadline=None,
+        priority=PRIORITY_NORMAL,
+        tenant=None,
     ):
         """
         Send push notification to a single device
@@ -41,44 +46,87 @@ class FCMNotification(BaseAPI):
             fcm_options (dict, optional): Platform independent options for features provided by the FCM SDKs -
                 https://firebase.google.com/docs/reference/fcm/rest/v1/projects.messages#fcmoptions
 
-            timeout (int, optional): Set time limit for the request
+            timeout (int or Timeout, optional): Set time limit for the request, or separate
+                connect/read/total limits with a Timeout
+            deadline (Deadline or float, optional): overall time limit covering token refresh,
+                Retry-After sleeps, retries and the HTTP exchange. A Deadline can be shared between calls
+            priority (str, optional): scheduler lane, "high" for transactional messages, "normal" or "bulk"
+            tenant (optional): scheduler tenant the message is accounted to for weighted fairness
 
         Returns:
             dict: name (str) - The identifier of the message sent, in the format of projects/*/messages/{message_id}
+            None: the circuit breaker is open and the message was handed to its `on_reject` callback
 
         Raises:
             FCMServerError: FCM is temporary not available
+            FCMCircuitOpenError: the circuit breaker is open and has no `on_reject` callback
+            FCMTimeoutError: the deadline expired before the message could be sent
             AuthenticationError: error authenticating the sender account
             InvalidDataError: data passed to FCM was incorrecly structured
             FCMSenderIdMismatchError: the authenticated sender is different from the sender registered to the token
             FCMNotRegisteredError: device token is missing, not registered, or invalid
         """
-        payload = self.parse_payload(
-            fcm_token=fcm_token,
-            notification_title=notification_title,
-            notification_body=notification_body,
-            notification_image=notification_image,
-            data_payload=data_payload,
-            topic_name=topic_name,
-            topic_condition=topic_condition,
-            android_config=android_config,
-            apns_config=apns_config,
-            webpush_config=webpush_config,
-            fcm_options=fcm_options,
-            dry_run=dry_run,
-        )
-        response = self.send_request(payload, timeout)
-        return self.parse_response(response)
+        with stage(self.profiler, "notify"):
+            with stage(self.profiler, "parse_payload"):
+                payload = self.parse_payload(
+                    fcm_token=fcm_token,
+                    notification_title=notification_title,
+                    notification_body=notification_body,
+                    notification_image=notification_image,
+                    data_payload=data_payload,
+                    topic_name=topic_name,
+                    topic_condition=topic_condition,
+                    android_config=android_config,
+                    apns_config=apns_config,
+                    webpush_config=webpush_config,
+                    fcm_options=fcm_options,
+                    dry_run=dry_run,
+                )
+            response = self.send_request(payload, timeout, deadline, priority, tenant)
+            if response is None:
+                return None
+            with stage(self.profiler, "parse_response"):
+                return self.parse_response(response)
 
-    def async_notify_multiple_devices(self, params_list=None, timeout=5):
+    def async_notify_multiple_devices(
+        self,
+        params_list=None,
+        timeout=5,
+        deadline=None,
+        priority=PRIORITY_NORMAL,
+        tenant=None,
+        concurrency=None,
+        sink=None,
+    ):
         """
         Sends push notification to multiple devices with personalized templates
 
         Args:
-            params_list (list): list of parameters (the same as notify_multiple_devices)
-            timeout (int, optional): set time limit for the request
+            params_list (list or MessageBatch): list of parameters (the same as notify_multiple_devices),
+                or any iterable of them. Messages are serialized lazily, one at a time, as they are sent
+            timeout (int or Timeout, optional): set time limit for each request. The `total` of a
+                Timeout bounds the whole batch, like `deadline`, as it bounds the whole call of `notify`
+            deadline (Deadline or float, optional): campaign-wide time limit. Requests still
+                outstanding when it expires are cancelled and reported as DEADLINE_EXCEEDED errors
+            priority (str, optional): scheduler lane of the batch, usually "bulk"
+            tenant (optional): scheduler tenant the batch is accounted to
+            concurrency (int, optional): maximum number of requests in flight, 1000 by default
+            sink (ResultSink, optional): sink the outcome of every message is written to, as
+                a record with its index, fcm_token, message name and error code. Results are
+                not collected in memory then, and None is returned once they are all written
+
+        Returns:
+            list: one response per message, in order, unless a sink is given
         """
         if params_list is None:
             params_list = []
 
-        return self.send_async_request(params_list=params_list, timeout=timeout)
+        return self.send_async_request(
+            params_list=params_list,
+            timeout=timeout,
+            deadline=deadline,
+            priority=priority,
+            tenant=tenant,
+            concurrency=concurrency,
+            sink=sink,
+        )
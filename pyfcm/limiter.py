@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+from pyfcm.errors import FCMTimeoutError
+
+# Responses that mean FCM wants us to slow down
+BACKOFF_STATUS_CODES = frozenset([429, 503])
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Waiter(object):
+    """
+    A caller parked until a slot is handed to it. Threads wait on an event,
+    coroutines on a future bound to their own event loop.
+    """
+
+    __slots__ = ("loop", "event", "future")
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+class AdaptiveConcurrencyLimiter(object):
+    """
+    AIMD concurrency limiter for requests sent to the FCM endpoint.
+
+    The limit grows additively (about one slot per round trip) while observed
+    latency stays close to the best latency seen so far, and is cut
+    multiplicatively on 429/503 responses, timeouts and connection errors.
+    The same instance can be shared by threads and event loops.
+
+    Attributes:
+        history (deque): (timestamp, limit) pairs recorded on every change of the limit
+    """
+
+    def __init__(
+        self,
+        initial_limit=10,
+        min_limit=1,
+        max_limit=500,
+        backoff_ratio=0.5,
+        latency_tolerance=2.0,
+        history_size=1000,
+    ):
+        """
+        Attributes:
+            initial_limit (int): number of requests allowed in flight at start
+            min_limit (int): the limit never drops below this value
+            max_limit (int): the limit never grows above this value
+            backoff_ratio (float): factor applied to the limit on 429/503 or timeouts
+            latency_tolerance (float): growth stops once latency exceeds this multiple of the baseline
+            history_size (int): number of limit changes kept in `history`
+        """
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError("Expected 1 <= min_limit <= initial_limit <= max_limit")
+        if not 0 < backoff_ratio < 1:
+            raise ValueError("backoff_ratio must be between 0 and 1")
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.history = deque(maxlen=history_size)
+
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._min_latency = None
+        self._last_backoff = 0.0
+        self._backoff_cooldown = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self.history.append((time.time(), initial_limit))
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire(self, timeout=None):
+        """
+        Block the calling thread until a request slot is available
+
+        Args:
+            timeout (float, optional): seconds to wait at most, forever if None
+
+        Raises:
+            FCMTimeoutError: no slot became available within `timeout`
+        """
+        with self._lock:
+            if self._try_acquire():
+                return
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+        if not waiter.event.wait(timeout) and self._withdraw(waiter):
+            raise FCMTimeoutError(f"No request slot available within {timeout:.3f}s")
+
+    async def acquire_async(self, timeout=None):
+        """
+        Wait, without blocking the event loop, until a request slot is available
+
+        Args:
+            timeout (float, optional): seconds to wait at most, forever if None
+
+        Raises:
+            FCMTimeoutError: no slot became available within `timeout`
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                return
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait({waiter.future}, timeout=timeout)
+        except asyncio.CancelledError:
+            if not self._withdraw(waiter):
+                self.release()
+            raise
+        if not waiter.future.done() and self._withdraw(waiter):
+            raise FCMTimeoutError(f"No request slot available within {timeout:.3f}s")
+
+    def release(self, latency=None, status_code=None, dropped=False):
+        """
+        Give a slot back and feed the outcome of the request into the limit
+
+        Args:
+            latency (float, optional): seconds spent waiting for the response
+            status_code (int, optional): HTTP status of the response
+            dropped (bool, optional): the request timed out or the connection failed
+        """
+        with self._lock:
+            self._in_flight -= 1
+            self._record(latency, status_code, dropped)
+            self._wake_waiters()
+
+    def record(self, latency=None, status_code=None, dropped=False, in_flight=None):
+        """
+        Feed the outcome of a request into the limit without touching the slots
+        held on this limiter, for callers that do their own admission
+
+        Args:
+            latency (float, optional): seconds spent waiting for the response
+            status_code (int, optional): HTTP status of the response
+            dropped (bool, optional): the request timed out or the connection failed
+            in_flight (int, optional): requests still in flight on the caller's side
+        """
+        with self._lock:
+            if in_flight is not None:
+                self._in_flight = in_flight
+            self._record(latency, status_code, dropped)
+
+    def _record(self, latency, status_code, dropped):
+        if dropped or status_code in BACKOFF_STATUS_CODES:
+            self._back_off(latency)
+        elif latency is not None:
+            self._grow(latency)
+
+    def _withdraw(self, waiter):
+        """
+        Returns:
+            bool: True if the waiter was removed, False if a slot was handed to it meanwhile
+        """
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return False
+            return True
+
+    def _try_acquire(self):
+        if self._waiters or self._in_flight >= self.limit:
+            return False
+        self._in_flight += 1
+        return True
+
+    def _wake_waiters(self):
+        while self._waiters and self._in_flight < self.limit:
+            self._in_flight += 1
+            self._waiters.popleft().wake()
+
+    def _grow(self, latency):
+        if self._min_latency is None or latency < self._min_latency:
+            self._min_latency = latency
+        else:
+            # let the baseline drift up slowly so a stale minimum does not pin the limit
+            self._min_latency += (latency - self._min_latency) * 0.01
+
+        if latency > self._min_latency * self.latency_tolerance:
+            return
+        # only grow when the current limit is actually being used
+        if self._in_flight + 1 < self._limit / 2:
+            return
+        self._set_limit(min(self.max_limit, self._limit + 1.0 / self._limit))
+
+    def _back_off(self, latency):
+        now = time.monotonic()
+        # responses to requests sent before the last cut carry no new information
+        if now - self._last_backoff < self._backoff_cooldown:
+            return
+        self._last_backoff = now
+        self._backoff_cooldown = latency or 0.0
+        self._set_limit(max(self.min_limit, self._limit * self.backoff_ratio))
+
+    def _set_limit(self, limit):
+        previous = self.limit
+        self._limit = limit
+        if self.limit != previous:
+            self.history.append((time.time(), self.limit))
@@ -0,0 +1,275 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+from pyfcm.errors import FCMTimeoutError
+from pyfcm.limiter import _Waiter
+
+PRIORITY_HIGH = "high"
+PRIORITY_NORMAL = "normal"
+PRIORITY_BULK = "bulk"
+
+# Lanes in the order they are served
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK)
+
+# Upper bound on how long a waiter sleeps before checking the rate limit again
+_MAX_POLL_INTERVAL = 0.05
+
+
+class _Ticket(object):
+    __slots__ = ("priority", "tenant", "waiter", "admitted")
+
+    def __init__(self, priority, tenant, waiter):
+        self.priority = priority
+        self.tenant = tenant
+        self.waiter = waiter
+        self.admitted = False
+
+
+class PriorityScheduler(object):
+    """
+    Admission scheduler in front of the senders, with one lane per priority.
+
+    Waiting requests are admitted strictly by lane (high, then normal, then
+    bulk). `reserved_concurrency` slots and a `reserved_rate` share of the rate
+    budget can only be used by the high priority lane, so transactional
+    messages are not stuck behind a large bulk campaign. Within a lane, tenants
+    are served by weighted fair queuing: a tenant with weight 2 is admitted
+    twice as often as a tenant with weight 1 while both have requests waiting.
+
+    The same instance can be shared by threads and event loops.
+    """
+
+    def __init__(
+        self,
+        max_concurrency=100,
+        reserved_concurrency=10,
+        rate=None,
+        burst=None,
+        reserved_rate=0.1,
+        tenant_weights=None,
+        limiter=None,
+    ):
+        """
+        Attributes:
+            max_concurrency (int): requests in flight across all lanes, ignored if `limiter` is set
+            reserved_concurrency (int): slots only the high priority lane may use
+            rate (float, optional): requests per second across all lanes, unlimited if None
+            burst (float, optional): size of the rate bucket, defaults to about one second worth of `rate`
+            reserved_rate (float): share of the rate bucket only the high priority lane may use
+            tenant_weights (dict, optional): weight per tenant, tenants not listed have weight 1
+            limiter (AdaptiveConcurrencyLimiter, optional): provides an adaptive concurrency
+                limit in place of `max_concurrency`
+        """
+        if reserved_concurrency >= max_concurrency and limiter is None:
+            raise ValueError("reserved_concurrency must be lower than max_concurrency")
+        if not 0 <= reserved_rate < 1:
+            raise ValueError("reserved_rate must be between 0 and 1")
+        if rate is not None and burst is None:
+            burst = max(rate, 1.0 / (1 - reserved_rate))
+        if burst is not None and burst * (1 - reserved_rate) < 1:
+            raise ValueError(
+                "burst is too small to leave room outside the reserved rate"
+            )
+
+        self.max_concurrency = max_concurrency
+        self.reserved_concurrency = reserved_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.reserved_rate = reserved_rate
+        self.tenant_weights = tenant_weights or {}
+        self.limiter = limiter
+
+        self._in_flight = 0
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._queues = {priority: {} for priority in PRIORITIES}
+        self._virtual_time = {priority: {} for priority in PRIORITIES}
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        if self.limiter is not None:
+            return self.limiter.limit
+        return self.max_concurrency
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def waiting(self, priority=None):
+        """
+        Returns:
+            int: number of requests waiting for admission, in one lane or in all of them
+        """
+        with self._lock:
+            priorities = PRIORITIES if priority is None else (priority,)
+            return sum(
+                len(queue)
+                for priority in priorities
+                for queue in self._queues[priority].values()
+            )
+
+    def acquire(self, priority=PRIORITY_NORMAL, tenant=None, timeout=None):
+        """
+        Block the calling thread until the request is admitted
+
+        Args:
+            timeout (float, optional): seconds to wait at most, forever if None
+
+        Raises:
+            FCMTimeoutError: the request was not admitted within `timeout`
+        """
+        expires = time.monotonic() + timeout if timeout is not None else None
+        ticket = self._enqueue(priority, tenant, _Waiter())
+        while not ticket.admitted:
+            wait = self._wait_interval(expires)
+            if wait is not None and wait <= 0:
+                self._timed_out(ticket, timeout)
+                return
+            ticket.waiter.event.wait(wait)
+            with self._lock:
+                self._dispatch()
+
+    async def acquire_async(self, priority=PRIORITY_NORMAL, tenant=None, timeout=None):
+        """
+        Wait, without blocking the event loop, until the request is admitted
+
+        Args:
+            timeout (float, optional): seconds to wait at most, forever if None
+
+        Raises:
+            FCMTimeoutError: the request was not admitted within `timeout`
+        """
+        expires = time.monotonic() + timeout if timeout is not None else None
+        ticket = self._enqueue(priority, tenant, _Waiter(asyncio.get_running_loop()))
+        try:
+            while not ticket.admitted:
+                wait = self._wait_interval(expires)
+                if wait is not None and wait <= 0:
+                    self._timed_out(ticket, timeout)
+                    return
+                await asyncio.wait({ticket.waiter.future}, timeout=wait)
+                with self._lock:
+                    self._dispatch()
+        except asyncio.CancelledError:
+            if not self._withdraw(ticket):
+                self.release()
+            raise
+
+    def release(self, latency=None, status_code=None, dropped=False):
+        """
+        Give a slot back, and feed the outcome of the request into the limiter if one is set
+
+        Args:
+            latency (float, optional): seconds spent waiting for the response
+            status_code (int, optional): HTTP status of the response
+            dropped (bool, optional): the request timed out or the connection failed
+        """
+        with self._lock:
+            self._in_flight -= 1
+            in_flight = self._in_flight
+        if self.limiter is not None:
+            self.limiter.record(latency, status_code, dropped, in_flight=in_flight)
+        with self._lock:
+            self._dispatch()
+
+    def _withdraw(self, ticket):
+        """
+        Returns:
+            bool: True if the ticket was removed from its queue, False if it was admitted meanwhile
+        """
+        with self._lock:
+            if ticket.admitted:
+                return False
+            queues = self._queues[ticket.priority]
+            queues[ticket.tenant].remove(ticket)
+            if not queues[ticket.tenant]:
+                del queues[ticket.tenant]
+            return True
+
+    def _timed_out(self, ticket, timeout):
+        # admitted at the last moment, the caller keeps the slot
+        if self._withdraw(ticket):
+            raise FCMTimeoutError(f"Request not admitted within {timeout:.3f}s")
+
+    def _wait_interval(self, expires):
+        poll = self._poll_interval()
+        if expires is None:
+            return poll
+        remaining = expires - time.monotonic()
+        return remaining if poll is None else min(poll, remaining)
+
+    def _enqueue(self, priority, tenant, waiter):
+        if priority not in self._queues:
+            raise ValueError(
+                f"Unknown priority {priority!r}, expected one of {PRIORITIES}"
+            )
+        ticket = _Ticket(priority, tenant, waiter)
+        with self._lock:
+            queues = self._queues[priority]
+            if tenant not in queues:
+                # a tenant joining the lane starts level with the others, not with credit
+                clocks = self._virtual_time[priority]
+                clocks[tenant] = max(
+                    clocks.get(tenant, 0.0),
+                    min((clocks[other] for other in queues), default=0.0),
+                )
+                queues[tenant] = deque()
+            queues[tenant].append(ticket)
+            self._dispatch()
+        return ticket
+
+    def _dispatch(self):
+        self._refill()
+        for priority in PRIORITIES:
+            queues = self._queues[priority]
+            while queues:
+                if not self._has_room(priority):
+                    # lower lanes have less headroom, they cannot be admitted either
+                    return
+                tenant = self._next_tenant(priority)
+                queue = queues[tenant]
+                ticket = queue.popleft()
+                if not queue:
+                    del queues[tenant]
+                self._virtual_time[priority][tenant] += 1.0 / self.tenant_weights.get(
+                    tenant, 1
+                )
+                self._in_flight += 1
+                if self.rate is not None:
+                    self._tokens -= 1
+                ticket.admitted = True
+                ticket.waiter.wake()
+
+    def _has_room(self, priority):
+        reserved = priority != PRIORITY_HIGH
+        capacity = self.capacity
+        if reserved:
+            # an adaptive limit can shrink below the reservation, keep one slot for the other lanes
+            capacity -= min(self.reserved_concurrency, capacity - 1)
+        if self._in_flight >= capacity:
+            return False
+        if self.rate is None:
+            return True
+        floor = self.reserved_rate * self.burst if reserved else 0.0
+        return self._tokens - 1 >= floor
+
+    def _next_tenant(self, priority):
+        clocks = self._virtual_time[priority]
+        return min(self._queues[priority], key=lambda tenant: clocks[tenant])
+
+    def _refill(self):
+        if self.rate is None:
+            return
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._refilled_at) * self.rate
+        )
+        self._refilled_at = now
+
+    def _poll_interval(self):
+        if self.rate is None:
+            return None
+        return min(_MAX_POLL_INTERVAL, 1.0 / self.rate)
@@ -0,0 +1,199 @@
+"""
+Opt-in timing of the stages of a send, to find where throughput goes.
+
+Each stage (payload building, JSON encoding, token refresh, admission, the
+HTTP exchange, response parsing) is timed with a wall clock and the thread's
+CPU clock, and aggregated into log2 histograms shared by all threads and
+coroutines. Stages nest through a context variable, so the collapsed stacks
+written by `Profiler.dump` can be rendered by flamegraph.pl or speedscope.
+
+CPU time is measured per thread: for a stage that awaits, it also includes
+the work of the other coroutines run by the event loop in the meantime.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+_DISABLED = nullcontext()
+
+# stack of the stages the current thread or coroutine is in
+_frames = contextvars.ContextVar("pyfcm_profiler_frames", default=())
+
+
+def stage(profiler, name):
+    """
+    Returns:
+        context manager timing `name` with `profiler`, or doing nothing if it is None
+    """
+    if profiler is None:
+        return _DISABLED
+    return profiler.stage(name)
+
+
+class _Frame(object):
+    __slots__ = ("name", "path", "children_wall")
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.children_wall = 0.0
+
+
+class _Stats(object):
+    __slots__ = ("count", "wall", "cpu", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        # number of samples per power of two of their wall time in microseconds
+        self.histogram = []
+
+    def add(self, wall, cpu):
+        self.count += 1
+        self.wall += wall
+        self.cpu += cpu
+        bucket = int(wall * 1e6).bit_length()
+        if bucket >= len(self.histogram):
+            self.histogram.extend([0] * (bucket + 1 - len(self.histogram)))
+        self.histogram[bucket] += 1
+
+    def percentile(self, fraction):
+        """
+        Returns:
+            float: upper bound in seconds of the histogram bucket holding the percentile
+        """
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if seen >= rank:
+                return (1 << bucket) / 1e6
+        return 0.0
+
+
+class Profiler(object):
+    """
+    Collects the time spent in each stage of a send, across threads and coroutines.
+    """
+
+    def __init__(self, report=None, collapsed_path=None):
+        """
+        Attributes:
+            report (callable, optional): called with the summary report by `dump`, e.g. `print`
+                or `logger.info`
+            collapsed_path (str, optional): file `dump` writes the collapsed stacks to, in the
+                format of flamegraph.pl
+        """
+        self.report_to = report
+        self.collapsed_path = collapsed_path
+        self._stats = {}
+        self._self_time = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block as stage `name`, nested in the stage it runs in
+        """
+        frames = _frames.get()
+        parent = frames[-1] if frames else None
+        frame = _Frame(name, f"{parent.path};{name}" if parent else name)
+        token = _frames.set(frames + (frame,))
+        wall_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_started
+            cpu = time.thread_time() - cpu_started
+            _frames.reset(token)
+            if parent is not None:
+                parent.children_wall += wall
+            # concurrent children can add up to more than the parent's wall time
+            self_time = max(0.0, wall - frame.children_wall)
+            with self._lock:
+                stats = self._stats.get(name)
+                if stats is None:
+                    stats = self._stats[name] = _Stats()
+                stats.add(wall, cpu)
+                self._self_time[frame.path] = (
+                    self._self_time.get(frame.path, 0.0) + self_time
+                )
+
+    def stats(self):
+        """
+        Returns:
+            dict: per stage, count (int), wall and cpu (float) seconds in total, p50 and p99 (float)
+                wall seconds, and the wall time histogram (list) of samples per power of two microseconds
+        """
+        with self._lock:
+            return {
+                name: {
+                    "count": stats.count,
+                    "wall": stats.wall,
+                    "cpu": stats.cpu,
+                    "p50": stats.percentile(0.5),
+                    "p99": stats.percentile(0.99),
+                    "histogram": list(stats.histogram),
+                }
+                for name, stats in self._stats.items()
+            }
+
+    def report(self):
+        """
+        Returns:
+            str: table of the stages, the slowest in total first
+        """
+        stats = sorted(self.stats().items(), key=lambda item: -item[1]["wall"])
+        lines = [
+            f"{'stage':<16}{'count':>9}{'wall s':>11}{'cpu s':>11}"
+            f"{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}"
+        ]
+        for name, stage_stats in stats:
+            count = stage_stats["count"]
+            lines.append(
+                f"{name:<16}{count:>9}{stage_stats['wall']:>11.3f}{stage_stats['cpu']:>11.3f}"
+                f"{stage_stats['wall'] / count * 1e3:>10.3f}"
+                f"{stage_stats['p50'] * 1e3:>10.3f}{stage_stats['p99'] * 1e3:>10.3f}"
+            )
+        return "\n".join(lines)
+
+    def collapsed(self):
+        """
+        Returns:
+            str: one line per stack of stages with its self time in microseconds
+        """
+        with self._lock:
+            self_time = sorted(self._self_time.items())
+        return "".join(
+            f"{path} {round(seconds * 1e6)}\n" for path, seconds in self_time
+        )
+
+    def dump(self, reset=False):
+        """
+        Hands the report to `report` and writes the collapsed stacks to `collapsed_path`, if set.
+        Called at the end of each async batch, with `reset` so each dump covers one batch
+
+        Args:
+            reset (bool): start over once the stats are taken, so the next dump only covers
+                the stages timed after this one
+        """
+        snapshot = self
+        if reset:
+            snapshot = Profiler()
+            with self._lock:
+                snapshot._stats, self._stats = self._stats, {}
+                snapshot._self_time, self._self_time = self._self_time, {}
+        if self.report_to is not None:
+            self.report_to(snapshot.report())
+        if self.collapsed_path is not None:
+            with open(self.collapsed_path, "w", encoding="utf8") as f:
+                f.write(snapshot.collapsed())
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._self_time = {}
@@ -0,0 +1,50 @@
+"""
+Targeted parsing of FCM response bodies, used by the lean response mode.
+
+A successful send only carries the message name, so instead of decoding the
+whole body into a dict the fields we need are picked out of the raw bytes.
+Anything the patterns do not match (escaped characters, unexpected layout)
+falls back to a regular JSON decode.
+"""
+
+import json
+import re
+
+_NAME = re.compile(rb'"name"\s*:\s*"([^"\\]*)"')
+_STATUS = re.compile(rb'"status"\s*:\s*"([A-Z_]*)"')
+_ERROR_CODE = re.compile(rb'"errorCode"\s*:\s*"([A-Z_]*)"')
+
+
+def extract_name(body):
+    """
+    Args:
+        body (bytes): body of a successful response
+
+    Returns:
+        str: name of the message sent, in the format of projects/*/messages/{message_id}
+    """
+    match = _NAME.search(body)
+    if match is not None:
+        return match.group(1).decode("utf8")
+    return json.loads(body).get("name")
+
+
+def extract_error(status_code, body):
+    """
+    Args:
+        status_code (int): HTTP status of the response
+        body (bytes): body of an error response
+
+    Returns:
+        dict: error (dict) - code (int), status (str) and errorCode (str) of the error, the
+            last two are None if the body does not carry them
+    """
+    status = _STATUS.search(body)
+    error_code = _ERROR_CODE.search(body)
+    return {
+        "error": {
+            "code": status_code,
+            "status": status.group(1).decode("ascii") if status else None,
+            "errorCode": error_code.group(1).decode("ascii") if error_code else None,
+        }
+    }
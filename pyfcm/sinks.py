@@ -0,0 +1,259 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+def make_record(index, params, result):
+    """
+    Builds the record written to a sink for one message of a batch
+
+    Args:
+        index (int): position of the message in the batch
+        params: item of the batch, usually the keyword arguments of `notify`
+        result: response of the message, as returned by the async path
+
+    Returns:
+        dict: index (int), fcm_token (str), name (str) and error (str), the last three may be None
+    """
+    fcm_token = params.get("fcm_token") if isinstance(params, dict) else None
+    name = error = None
+    if result is None:
+        error = "DEFERRED"
+    elif isinstance(result, str):
+        name = result
+    elif "error" in result:
+        details = result["error"]
+        error = details.get("errorCode")
+        for detail in details.get("details") or ():
+            error = error or detail.get("errorCode")
+        error = error or details.get("status") or str(details.get("code"))
+    else:
+        name = result.get("name")
+    return {"index": index, "fcm_token": fcm_token, "name": name, "error": error}
+
+
+class ResultSink(object):
+    """
+    Base class of the sinks persisting the outcome of every message of a batch.
+
+    Records are queued by the sender and written in batches by a background
+    thread, whenever `batch_size` records are pending or `flush_interval`
+    seconds have passed. The queue is bounded: once `max_pending` records wait
+    to be written, the sender waits too instead of using more memory.
+
+    Subclasses implement `write_batch`, and optionally `open` and `close_sink`,
+    which are all called from the background thread.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_pending=10000):
+        """
+        Attributes:
+            batch_size (int): records written at once
+            flush_interval (float): seconds after which pending records are written anyway
+            max_pending (int): records queued before the sender is slowed down
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, record, timeout=None):
+        """
+        Queues a record, blocking while the queue is full
+
+        Raises:
+            queue.Full: the record could not be queued within `timeout` seconds
+            ValueError: the sink is closed
+            the error raised by the last failed write, if any
+        """
+        self._check_open()
+        self._queue.put(record, timeout=timeout)
+
+    def put_nowait(self, record):
+        """
+        Raises:
+            queue.Full: the queue is full
+            ValueError: the sink is closed
+        """
+        self._check_open()
+        self._queue.put_nowait(record)
+
+    def flush(self):
+        """
+        Blocks until every record queued so far is written
+
+        Raises:
+            ValueError: the sink is closed, its records are already written
+        """
+        self._check_open()
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        done.wait()
+        self._check()
+
+    def close(self):
+        """
+        Writes the pending records and stops the background thread
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((_CLOSE, None))
+        self._thread.join()
+        self._check()
+
+    def open(self):
+        pass
+
+    def write_batch(self, records):
+        raise NotImplementedError
+
+    def close_sink(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+    def _check_open(self):
+        # the background thread is gone, a record queued now would never be written
+        if self._closed:
+            raise ValueError("The sink is closed")
+        self._check()
+
+    def _run(self):
+        pending = []
+        deadline = None
+        try:
+            self.open()
+        except Exception as e:
+            self.error = e
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and not isinstance(item, tuple):
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(pending) < self.batch_size:
+                    continue
+
+            self._write(pending)
+            pending = []
+            deadline = None
+            if isinstance(item, tuple):
+                command, done = item
+                if command is _FLUSH:
+                    done.set()
+                    continue
+                break
+
+        try:
+            self.close_sink()
+        except Exception as e:
+            self.error = self.error or e
+
+    def _write(self, records):
+        # after a failure records are dropped, the error is raised to the sender instead
+        if not records or self.error is not None:
+            return
+        try:
+            self.write_batch(records)
+        except Exception as e:
+            self.error = e
+
+
+class CallbackSink(ResultSink):
+    """
+    Hands every chunk of records to `callback`, from the background thread
+    """
+
+    def __init__(self, callback, **kwargs):
+        self.callback = callback
+        super().__init__(**kwargs)
+
+    def write_batch(self, records):
+        self.callback(records)
+
+
+class NDJSONSink(ResultSink):
+    """
+    Appends one JSON object per record to a newline-delimited JSON file
+    """
+
+    def __init__(self, path, **kwargs):
+        self.path = path
+        self._file = None
+        super().__init__(**kwargs)
+
+    def open(self):
+        self._file = open(self.path, "a", encoding="utf8")
+
+    def write_batch(self, records):
+        self._file.write(
+            "".join(
+                json.dumps(record, separators=(",", ":")) + "\n" for record in records
+            )
+        )
+        self._file.flush()
+
+    def close_sink(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class SQLiteSink(ResultSink):
+    """
+    Inserts the records into a SQLite table, created if missing, one transaction per chunk
+    """
+
+    COLUMNS = ("index", "fcm_token", "name", "error")
+
+    def __init__(self, path, table="fcm_results", **kwargs):
+        if not table.isidentifier():
+            raise ValueError("table must be a valid identifier")
+        self.path = path
+        self.table = table
+        self._connection = None
+        super().__init__(**kwargs)
+
+    def open(self):
+        # sqlite connections belong to the thread that created them
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.table}" '
+            '("index" INTEGER, fcm_token TEXT, name TEXT, error TEXT)'
+        )
+        self._connection.commit()
+
+    def write_batch(self, records):
+        with self._connection:
+            self._connection.executemany(
+                f'INSERT INTO "{self.table}" VALUES (?, ?, ?, ?)',
+                [
+                    tuple(record[column] for column in self.COLUMNS)
+                    for record in records
+                ],
+            )
+
+    def close_sink(self):
+        if self._connection is not None:
+            self._connection.close()
@@ -0,0 +1,106 @@
+import time
+
+from pyfcm.errors import FCMTimeoutError
+
+
+class Timeout(object):
+    """
+    Per-phase time limits for a request.
+
+    A plain number is still accepted wherever a timeout is expected and keeps
+    its previous meaning (connect and read timeout for the sync path, total
+    timeout for the async path).
+    """
+
+    def __init__(self, connect=None, read=None, total=None):
+        """
+        Attributes:
+            connect (float, optional): seconds to establish the connection, including TLS
+            read (float, optional): seconds to wait for the server between bytes of the response
+            total (float, optional): overall budget for the call, covering token refresh,
+                Retry-After sleeps, retries and the HTTP exchange
+        """
+        self.connect = connect
+        self.read = read
+        self.total = total
+
+    def __repr__(self):
+        return f"Timeout(connect={self.connect}, read={self.read}, total={self.total})"
+
+
+class Deadline(object):
+    """
+    Point in time after which no further work should be started for a call or a batch
+    """
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def coerce(cls, deadline):
+        if deadline is None or isinstance(deadline, Deadline):
+            return deadline
+        return cls(deadline)
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def check(self, phase):
+        """
+        Raises:
+            FCMTimeoutError: the deadline passed before `phase` could start
+        """
+        if self.expired:
+            raise FCMTimeoutError(f"Deadline exceeded before {phase}")
+
+
+def resolve_deadline(timeout, deadline=None):
+    """
+    Combines an explicit deadline with the `total` of a Timeout, whichever expires first
+    """
+    deadline = Deadline.coerce(deadline)
+    if isinstance(timeout, Timeout) and timeout.total is not None:
+        total = Deadline(timeout.total)
+        if deadline is None or total.expires_at < deadline.expires_at:
+            return total
+    return deadline
+
+
+def _cap(seconds, remaining):
+    if remaining is None:
+        return seconds
+    if seconds is None:
+        return remaining
+    return min(seconds, remaining)
+
+
+def requests_timeout(timeout, deadline=None):
+    """
+    Returns:
+        the `timeout` argument for requests: a number, a (connect, read) tuple or None
+    """
+    remaining = deadline.remaining() if deadline is not None else None
+    if isinstance(timeout, Timeout):
+        return (_cap(timeout.connect, remaining), _cap(timeout.read, remaining))
+    return _cap(timeout, remaining)
+
+
+def aiohttp_timeout(timeout, deadline=None):
+    """
+    Returns:
+        aiohttp.ClientTimeout: per-request timeout, bounded by the deadline
+    """
+    import aiohttp
+
+    remaining = deadline.remaining() if deadline is not None else None
+    if isinstance(timeout, Timeout):
+        return aiohttp.ClientTimeout(
+            total=_cap(timeout.total, remaining),
+            connect=timeout.connect,
+            sock_read=timeout.read,
+        )
+    return aiohttp.ClientTimeout(total=_cap(timeout, remaining))
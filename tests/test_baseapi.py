@@ -1,6 +1,9 @@
 import json
 import time
 
+from pyfcm.baseapi import MAX_RETRIES
+from pyfcm.limiter import AdaptiveConcurrencyLimiter
+
 
 def test_json_dumps(base_api):
     json_string = base_api.json_dumps([{"test": "Test"}, {"test2": "Test2"}])
@@ -84,6 +87,31 @@ def test_send_request_retry_after(base_api, mocker):
     assert result == success_response
 
 
+def test_send_request_retry_after_is_bounded(base_api, mocker):
+    """Test that send_request gives up after MAX_RETRIES when Retry-After never stops"""
+
+    mock_sleep = mocker.patch("time.sleep")
+
+    retry_response = mocker.Mock()
+    retry_response.status_code = 503
+    retry_response.headers = {"Retry-After": "1"}
+
+    mock_session = mocker.Mock()
+    mock_session.post.return_value = retry_response
+
+    base_api.thread_local = mocker.Mock()
+    base_api.thread_local.requests_session = mock_session
+    base_api.thread_local.token_expiry = time.time() + 1000
+
+    # do
+    result = base_api.send_request(payload="test_payload", timeout=30)
+
+    # check
+    assert result == retry_response
+    assert mock_session.post.call_count == MAX_RETRIES + 1
+    assert mock_sleep.call_count == MAX_RETRIES
+
+
 def test_send_request_access_token_expired_retry(base_api, mocker):
     """Test that send_request retries when ACCESS_TOKEN_EXPIRED error occurs"""
 
@@ -126,3 +154,34 @@ def test_send_request_access_token_expired_retry(base_api, mocker):
     assert mock_session.post.call_count == 2
     assert base_api.thread_local.token_expiry == 0
     assert result == success_response
+
+
+def test_send_request_feeds_concurrency_limiter(base_api, mocker):
+    """Test that throttled responses shrink the concurrency limit"""
+
+    mocker.patch("time.sleep")
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+    mocker.patch.object(base_api, "concurrency_limiter", limiter)
+
+    throttled_response = mocker.Mock()
+    throttled_response.status_code = 429
+    throttled_response.headers = {"Retry-After": "1"}
+
+    success_response = mocker.Mock()
+    success_response.status_code = 200
+    success_response.headers = {}
+
+    mock_session = mocker.Mock()
+    mock_session.post.side_effect = [throttled_response, success_response]
+
+    base_api.thread_local = mocker.Mock()
+    base_api.thread_local.requests_session = mock_session
+    base_api.thread_local.token_expiry = time.time() + 1000
+
+    # do
+    result = base_api.send_request(payload="test_payload", timeout=30)
+
+    # check
+    assert result == success_response
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
@@ -0,0 +1,147 @@
+import asyncio
+import tracemalloc
+
+import pytest
+
+from pyfcm import MessageBatch, async_fcm, errors
+
+TOKEN = "d" * 140 + ":APA91b%06d"
+
+
+def test_batch_params():
+    batch = MessageBatch(notification_title="Sale", data_payload={"campaign": "x"})
+    weekly = batch.add_template(notification_title="Weekly")
+    batch.add("token-1")
+    batch.add("token-2", data_payload={"name": "Bob"})
+    batch.add("token-3", template=weekly, notification_body="Hi")
+
+    assert len(batch) == 3
+    assert list(batch) == [
+        {
+            "notification_title": "Sale",
+            "data_payload": {"campaign": "x"},
+            "fcm_token": "token-1",
+        },
+        {
+            "notification_title": "Sale",
+            "data_payload": {"campaign": "x", "name": "Bob"},
+            "fcm_token": "token-2",
+        },
+        {
+            "notification_title": "Weekly",
+            "notification_body": "Hi",
+            "fcm_token": "token-3",
+        },
+    ]
+    assert batch[-1]["fcm_token"] == "token-3"
+    with pytest.raises(IndexError):
+        batch.add("token-4", template=5)
+
+
+def measure(build):
+    tracemalloc.start()
+    try:
+        container = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return container, size
+
+
+def test_batch_memory_footprint():
+    count = 20000
+    template = {"notification_title": "Sale", "notification_body": "50% off today"}
+
+    params_list, list_size = measure(
+        lambda: [
+            dict(template, fcm_token=TOKEN % i, data_payload={"user": str(i)})
+            for i in range(count)
+        ]
+    )
+
+    def build_batch():
+        batch = MessageBatch(**template)
+        for i in range(count):
+            batch.add(TOKEN % i, data_payload={"user": str(i)})
+        return batch
+
+    batch, batch_size = measure(build_batch)
+
+    assert list(batch) == params_list
+    assert batch_size < list_size * 0.6
+
+
+def test_fetch_tasks_serializes_lazily(mocker):
+    in_flight = 0
+    peak = 0
+    serialized = 0
+    completed = 0
+
+    async def fake_send_request(payload, **kwargs):
+        nonlocal in_flight, peak, completed
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        completed += 1
+        return {"name": payload}
+
+    def serialize(params):
+        nonlocal serialized
+        serialized += 1
+        # messages are only serialized when a worker is about to send them
+        assert serialized - completed <= 4
+        return params["fcm_token"]
+
+    mocker.patch("pyfcm.async_fcm.send_request", side_effect=fake_send_request)
+    batch = MessageBatch()
+    batch.extend(f"token-{i}" for i in range(100))
+
+    results = asyncio.run(
+        async_fcm.fetch_tasks(
+            end_point="end_point",
+            headers={},
+            payloads=batch,
+            timeout=5,
+            serialize=serialize,
+            concurrency=4,
+        )
+    )
+
+    assert peak == 4
+    assert results == [{"name": f"token-{i}"} for i in range(100)]
+
+
+def test_fetch_tasks_reports_invalid_items(mocker):
+    async def fake_send_request(payload, **kwargs):
+        return {"name": payload}
+
+    def serialize(params):
+        if not params["fcm_token"]:
+            raise errors.InvalidDataError("fcm_token is required")
+        return params["fcm_token"]
+
+    mocker.patch("pyfcm.async_fcm.send_request", side_effect=fake_send_request)
+
+    results = asyncio.run(
+        async_fcm.fetch_tasks(
+            end_point="end_point",
+            headers={},
+            payloads=[{"fcm_token": token} for token in ["a", "", "c"]],
+            timeout=5,
+            serialize=serialize,
+            concurrency=1,
+        )
+    )
+
+    assert results == [
+        {"name": "a"},
+        {
+            "error": {
+                "code": 400,
+                "status": "INVALID_ARGUMENT",
+                "message": "fcm_token is required",
+            }
+        },
+        {"name": "c"},
+    ]
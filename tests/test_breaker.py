@@ -0,0 +1,108 @@
+import asyncio
+import socket
+
+from pyfcm.async_fcm import (
+    CIRCUIT_OPEN_RESPONSE,
+    CONNECTION_ERROR_RESPONSE,
+    REQUEST_TIMEOUT_RESPONSE,
+    send_request,
+)
+from pyfcm.breaker import CircuitBreaker
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.minimum_calls):
+        assert breaker.allow_request()
+        breaker.record(None)
+
+
+def test_breaker_opens_on_failure_rate():
+    breaker = CircuitBreaker(failure_rate_threshold=0.5, minimum_calls=4)
+
+    for status_code in [200, 500, 200]:
+        breaker.allow_request()
+        breaker.record(status_code)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.allow_request()
+    breaker.record(None)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_breaker_ignores_client_errors():
+    breaker = CircuitBreaker(minimum_calls=2)
+
+    for status_code in [400, 404, 429, 401]:
+        breaker.allow_request()
+        breaker.record(status_code)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failure_rate == 0
+
+
+def test_breaker_half_open_probe(mocker):
+    mock_time = mocker.patch("pyfcm.breaker.time.monotonic", return_value=100)
+    breaker = CircuitBreaker(minimum_calls=2, reset_timeout=30)
+    open_breaker(breaker)
+
+    mock_time.return_value = 131
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record(500)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    mock_time.return_value = 162
+    assert breaker.allow_request()
+    breaker.record(200)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failure_rate == 0
+
+
+def test_async_send_request_fails_fast_when_open(mocker):
+    session = mocker.patch("pyfcm.async_fcm.aiohttp.ClientSession")
+    breaker = CircuitBreaker(minimum_calls=2)
+    open_breaker(breaker)
+
+    result = asyncio.run(send_request("end_point", {}, b"payload", breaker=breaker))
+
+    assert result == CIRCUIT_OPEN_RESPONSE
+    session.assert_not_called()
+
+    # every rejected message gets its own copy
+    result["error"]["code"] = 0
+    assert CIRCUIT_OPEN_RESPONSE["error"]["code"] == 503
+
+
+def test_async_send_request_defers_when_open(mocker):
+    mocker.patch("pyfcm.async_fcm.aiohttp.ClientSession")
+    deferred = []
+    breaker = CircuitBreaker(minimum_calls=2, on_reject=deferred.append)
+    open_breaker(breaker)
+
+    result = asyncio.run(send_request("end_point", {}, b"payload", breaker=breaker))
+
+    assert result is None
+    assert deferred == [b"payload"]
+
+
+def test_async_send_request_reports_failed_requests(mocker):
+    # a port nobody listens on
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    breaker = CircuitBreaker(minimum_calls=2)
+
+    result = asyncio.run(
+        send_request(f"http://127.0.0.1:{port}/", {}, b"payload", breaker=breaker)
+    )
+    assert result == CONNECTION_ERROR_RESPONSE
+
+    mocker.patch("pyfcm.async_fcm._post", side_effect=asyncio.TimeoutError)
+    result = asyncio.run(send_request("end_point", {}, b"payload", breaker=breaker))
+    assert result == REQUEST_TIMEOUT_RESPONSE
+
+    # both count as failures of the endpoint
+    assert breaker.state == CircuitBreaker.OPEN
@@ -0,0 +1,100 @@
+import time
+from datetime import datetime, time as local_time, timezone
+
+from pyfcm import CallbackSink, DeliveryScheduler, errors
+from pyfcm.delivery import next_local_time
+from pyfcm.emulator import FCMEmulator
+
+
+def test_next_local_time():
+    now = datetime(2024, 1, 1, 10, 0, tzinfo=timezone.utc)
+
+    # already 7pm in Tokyo, so the next 9am is tomorrow's
+    tokyo = next_local_time(local_time(9), "Asia/Tokyo", now=now)
+    assert tokyo.astimezone(timezone.utc) == datetime(
+        2024, 1, 2, 0, 0, tzinfo=timezone.utc
+    )
+
+    new_york = next_local_time(local_time(9), "America/New_York", now=now)
+    assert new_york.astimezone(timezone.utc) == datetime(
+        2024, 1, 1, 14, 0, tzinfo=timezone.utc
+    )
+
+
+def test_schedule_time_zones():
+    delivery = DeliveryScheduler(fcm=None, window=0)
+    delivery.schedule(datetime(2024, 6, 1, 9, 0), tz="Europe/Paris", fcm_token="a")
+    delivery.schedule(datetime(2024, 6, 1, 7, 30, tzinfo=timezone.utc), fcm_token="b")
+    delivery.schedule(1717225200.0, fcm_token="c")
+
+    remaining = delivery.stop()
+    assert [params["fcm_token"] for _, params in remaining] == ["a", "c", "b"]
+    # 9am in Paris is 7am UTC in summer
+    assert (
+        remaining[0][0] == datetime(2024, 6, 1, 7, 0, tzinfo=timezone.utc).timestamp()
+    )
+
+
+def test_bucket_is_spread_over_window():
+    window = 600
+    count = 1000
+    send_at = datetime(2024, 6, 1, 9, 0, tzinfo=timezone.utc).timestamp()
+    delivery = DeliveryScheduler(fcm=None, window=window)
+    for i in range(count):
+        delivery.schedule(send_at, fcm_token=f"token-{i}")
+
+    release_times = sorted(entry[0] for entry in delivery._heap)
+    assert release_times[0] == send_at
+    assert release_times[-1] < send_at + window
+    gaps = [later - earlier for earlier, later in zip(release_times, release_times[1:])]
+    # no burst and no hole: every gap stays within a small factor of the even spacing
+    assert max(gaps) < 3 * window / count
+    assert delivery.pending == count
+
+
+def test_delivery_sends_through_client():
+    records = []
+    with FCMEmulator(unregistered_tokens={"stale"}) as emulator:
+        fcm = emulator.client()
+        sink = CallbackSink(records.extend, flush_interval=0.01)
+        with DeliveryScheduler(fcm, window=0.2, workers=4, sink=sink) as delivery:
+            send_at = time.time() + 0.1
+            for i in range(19):
+                delivery.schedule(send_at, fcm_token=f"device-{i}")
+            delivery.schedule(send_at, fcm_token="stale")
+            assert delivery.join(timeout=5)
+        sink.close()
+
+    assert time.time() >= send_at
+    assert delivery.sent == 19 and delivery.failed == 1
+    assert emulator.stats["sent"] == 19
+    errors = {record["fcm_token"]: record["error"] for record in records}
+    assert len(errors) == 20
+    # the same FCM error codes as the records of async batches
+    assert errors["stale"] == "UNREGISTERED"
+    assert errors["device-0"] is None
+
+
+def test_delivery_counts_deferred_and_failed(mocker):
+    fcm = mocker.Mock()
+    fcm.notify.side_effect = [
+        None,
+        errors.FCMCircuitOpenError("open"),
+        errors.FCMTimeoutError("late"),
+        {"name": "projects/test/messages/1"},
+    ]
+    records = []
+    sink = CallbackSink(records.extend, flush_interval=0.01)
+    with DeliveryScheduler(fcm, window=0, workers=1, sink=sink) as delivery:
+        for i in range(4):
+            delivery.schedule(time.time(), fcm_token=f"device-{i}")
+        assert delivery.join(timeout=5)
+    sink.close()
+
+    assert (delivery.sent, delivery.failed, delivery.deferred) == (1, 2, 1)
+    assert sorted((record["index"], record["error"]) for record in records) == [
+        (0, "DEFERRED"),
+        (1, "UNAVAILABLE"),
+        (2, "DEADLINE_EXCEEDED"),
+        (3, None),
+    ]
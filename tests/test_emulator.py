@@ -0,0 +1,60 @@
+import pytest
+
+from pyfcm.emulator import FCMEmulator, uniform_latency
+from pyfcm.errors import FCMNotRegisteredError
+
+
+@pytest.fixture
+def emulator():
+    with FCMEmulator(project_id="test", unregistered_tokens={"stale"}) as emulator:
+        yield emulator
+
+
+def test_emulator_send(emulator):
+    fcm = emulator.client()
+    response = fcm.notify(fcm_token="device", notification_title="Hi")
+
+    assert response["name"] == "projects/test/messages/1"
+    with pytest.raises(FCMNotRegisteredError):
+        fcm.notify(fcm_token="stale", notification_title="Hi")
+    assert emulator.stats["unregistered"] == 1
+
+
+def test_emulator_quota_retry_after(emulator):
+    emulator.quota = 1
+    emulator.quota_window = 1
+    fcm = emulator.client()
+
+    fcm.notify(fcm_token="device", notification_title="Hi")
+    # throttled with Retry-After: 1, then sent once the window is over
+    response = fcm.notify(fcm_token="device", notification_title="Hi")
+
+    assert response["name"] == "projects/test/messages/2"
+    assert emulator.stats["throttled"] == 1
+
+
+def test_emulator_access_token_expired(emulator):
+    fcm = emulator.client()
+    fcm.notify(fcm_token="device", notification_title="Hi")
+
+    emulator.expire_tokens()
+    response = fcm.notify(fcm_token="device", notification_title="Hi")
+
+    assert response["name"] == "projects/test/messages/2"
+    assert emulator.stats["expired"] == 1
+    assert emulator.stats["tokens"] == 2
+
+
+def test_emulator_async_batch(emulator):
+    emulator.latency = uniform_latency(0.001, 0.01, seed=1)
+    fcm = emulator.client(lean_responses=True)
+    params_list = [{"fcm_token": f"device-{i}"} for i in range(200)]
+    params_list[7]["fcm_token"] = "stale"
+
+    results = fcm.async_notify_multiple_devices(params_list=params_list)
+
+    assert len(results) == 200
+    assert results[7] == {
+        "error": {"code": 404, "status": "NOT_FOUND", "errorCode": "UNREGISTERED"}
+    }
+    assert emulator.stats["sent"] == 199
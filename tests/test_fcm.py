@@ -1,6 +1,12 @@
 import pytest
 
-from pyfcm import FCMNotification, errors
+from pyfcm import (
+    CircuitBreaker,
+    FCMNotification,
+    PRIORITY_HIGH,
+    PriorityScheduler,
+    errors,
+)
 
 
 def test_push_service_without_credentials():
@@ -77,3 +83,45 @@ def test_notify(push_service, generate_response):
     )
 
     assert isinstance(response, dict)
+
+
+def test_notify_fails_fast_when_circuit_open(push_service, mocker):
+    breaker = CircuitBreaker(minimum_calls=1)
+    breaker.allow_request()
+    breaker.record(None)
+    mocker.patch.object(push_service, "circuit_breaker", breaker)
+    requests_session = mocker.patch.object(
+        FCMNotification, "requests_session", new_callable=mocker.PropertyMock
+    )
+
+    with pytest.raises(errors.FCMCircuitOpenError):
+        push_service.notify(fcm_token="Test", notification_body="Test")
+    # failing fast does not wait for a token refresh
+    requests_session.assert_not_called()
+
+    deferred = []
+    breaker.on_reject = deferred.append
+    assert push_service.notify(fcm_token="Test", notification_body="Test") is None
+    assert len(deferred) == 1
+
+
+def test_notify_is_admitted_by_scheduler(push_service, mocker):
+    scheduler = PriorityScheduler(max_concurrency=2, reserved_concurrency=1)
+    mocker.patch.object(push_service, "scheduler", scheduler)
+    acquire = mocker.spy(scheduler, "acquire")
+
+    response = mocker.Mock()
+    response.status_code = 200
+    response.headers = {}
+    response.json.return_value = {"name": "projects/test/messages/1"}
+    session = mocker.patch.object(
+        FCMNotification, "requests_session", new_callable=mocker.PropertyMock
+    )
+    session.return_value.post.return_value = response
+
+    push_service.notify(
+        fcm_token="Test", notification_body="Test", priority=PRIORITY_HIGH, tenant="otp"
+    )
+
+    acquire.assert_called_once_with(PRIORITY_HIGH, "otp", timeout=None)
+    assert scheduler.in_flight == 0
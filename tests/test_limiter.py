@@ -0,0 +1,115 @@
+import asyncio
+import threading
+
+import pytest
+
+from pyfcm.errors import FCMTimeoutError
+from pyfcm.limiter import AdaptiveConcurrencyLimiter
+
+
+def test_limiter_grows_while_latency_is_flat():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4)
+
+    for _ in range(50):
+        limiter.acquire()
+        limiter.acquire()
+        limiter.release(0.1, 200)
+        limiter.release(0.1, 200)
+
+    assert limiter.limit == 4
+    assert [limit for _, limit in limiter.history] == [2, 3, 4]
+
+
+def test_limiter_does_not_grow_when_latency_rises():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+    limiter.acquire()
+    limiter.release(0.1, 200)
+
+    for _ in range(20):
+        limiter.acquire()
+        limiter.acquire()
+        limiter.release(1.0, 200)
+        limiter.release(1.0, 200)
+
+    assert limiter.limit == 2
+
+
+@pytest.mark.parametrize("status_code", [429, 503])
+def test_limiter_backs_off_on_throttling(status_code):
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+
+    limiter.acquire()
+    limiter.release(0.1, status_code)
+
+    assert limiter.limit == 4
+    assert limiter.history[-1][1] == 4
+
+
+def test_limiter_backs_off_once_per_round_trip():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+
+    for _ in range(3):
+        limiter.acquire()
+    for _ in range(3):
+        limiter.release(10, 429)
+
+    assert limiter.limit == 4
+
+
+def test_limiter_blocks_threads_above_limit():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def worker():
+        limiter.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert not acquired.wait(0.05)
+
+    limiter.release()
+    thread.join(1)
+    assert acquired.is_set()
+    assert limiter.in_flight == 1
+
+
+def test_limiter_async_waiters():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        await limiter.acquire_async()
+        peak = max(peak, limiter.in_flight)
+        await asyncio.sleep(0.01)
+        limiter.release()
+
+    async def run():
+        await asyncio.gather(*[request() for _ in range(10)])
+
+    asyncio.run(run())
+    assert peak == 2
+    assert limiter.in_flight == 0
+
+
+def test_limiter_acquire_timeout():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+    limiter.acquire()
+
+    with pytest.raises(FCMTimeoutError):
+        limiter.acquire(timeout=0.05)
+    # the waiter was withdrawn, the released slot is not handed to it
+    limiter.release()
+    assert limiter.in_flight == 0
+
+    limiter.acquire()
+
+    async def run():
+        with pytest.raises(FCMTimeoutError):
+            await limiter.acquire_async(timeout=0.05)
+
+    asyncio.run(run())
+    limiter.release()
+    assert limiter.in_flight == 0
@@ -0,0 +1,149 @@
+import asyncio
+import threading
+
+import pytest
+
+from pyfcm.errors import FCMTimeoutError
+from pyfcm.limiter import AdaptiveConcurrencyLimiter
+from pyfcm.priority import (
+    PRIORITY_BULK,
+    PRIORITY_HIGH,
+    PRIORITY_NORMAL,
+    PriorityScheduler,
+)
+
+
+def acquire_in_thread(scheduler, priority, tenant=None):
+    admitted = threading.Event()
+
+    def worker():
+        scheduler.acquire(priority, tenant)
+        admitted.set()
+
+    threading.Thread(target=worker, daemon=True).start()
+    return admitted
+
+
+def test_reserved_concurrency_is_kept_for_high_priority():
+    scheduler = PriorityScheduler(max_concurrency=3, reserved_concurrency=1)
+    scheduler.acquire(PRIORITY_BULK)
+    scheduler.acquire(PRIORITY_BULK)
+
+    bulk = acquire_in_thread(scheduler, PRIORITY_BULK)
+    assert not bulk.wait(0.05)
+
+    scheduler.acquire(PRIORITY_HIGH)
+    assert scheduler.in_flight == 3
+    assert scheduler.waiting(PRIORITY_BULK) == 1
+
+    scheduler.release()
+    assert not bulk.wait(0.05)
+    scheduler.release()
+    assert bulk.wait(1)
+
+
+def test_high_priority_is_admitted_first():
+    scheduler = PriorityScheduler(max_concurrency=2, reserved_concurrency=1)
+    order = []
+
+    async def request(priority):
+        await scheduler.acquire_async(priority)
+        order.append(priority)
+        await asyncio.sleep(0)
+        scheduler.release()
+
+    async def run():
+        await scheduler.acquire_async(PRIORITY_HIGH)
+        await scheduler.acquire_async(PRIORITY_HIGH)
+        tasks = [
+            asyncio.ensure_future(request(priority))
+            for priority in [PRIORITY_BULK, PRIORITY_NORMAL, PRIORITY_HIGH]
+        ]
+        await asyncio.sleep(0)
+        scheduler.release()
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == [PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK]
+
+
+def test_weighted_fairness_between_tenants():
+    scheduler = PriorityScheduler(
+        max_concurrency=2, reserved_concurrency=1, tenant_weights={"a": 2}
+    )
+    order = []
+
+    async def request(tenant):
+        await scheduler.acquire_async(PRIORITY_BULK, tenant)
+        order.append(tenant)
+        await asyncio.sleep(0)
+        scheduler.release()
+
+    async def run():
+        await scheduler.acquire_async(PRIORITY_BULK)
+        tasks = [asyncio.ensure_future(request(tenant)) for tenant in "bbbbbbaaaaaa"]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    # "a" is served twice as often while both tenants are waiting
+    assert "".join(order) == "baabaabaabbb"
+
+
+def test_reserved_rate_is_kept_for_high_priority(mocker):
+    mock_time = mocker.patch("pyfcm.priority.time.monotonic", return_value=0)
+    scheduler = PriorityScheduler(
+        max_concurrency=100, reserved_concurrency=1, rate=10, reserved_rate=0.2
+    )
+
+    for _ in range(8):
+        scheduler.acquire(PRIORITY_BULK)
+    assert scheduler._tokens == 2
+
+    bulk = acquire_in_thread(scheduler, PRIORITY_BULK)
+    assert not bulk.wait(0.1)
+    scheduler.acquire(PRIORITY_HIGH)
+    scheduler.acquire(PRIORITY_HIGH)
+
+    mock_time.return_value = 1
+    assert bulk.wait(1)
+
+
+def test_adaptive_limit_drives_capacity():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4)
+    scheduler = PriorityScheduler(reserved_concurrency=10, limiter=limiter)
+    assert scheduler.capacity == 4
+
+    scheduler.acquire(PRIORITY_BULK)
+    scheduler.release(0.1, 429)
+    assert scheduler.capacity == 2
+
+    # the reservation never takes every slot
+    scheduler.acquire(PRIORITY_BULK)
+    scheduler.acquire(PRIORITY_HIGH)
+    assert scheduler.in_flight == 2
+
+
+def test_unknown_priority():
+    with pytest.raises(ValueError):
+        PriorityScheduler().acquire("urgent")
+
+
+def test_acquire_timeout():
+    scheduler = PriorityScheduler(max_concurrency=2, reserved_concurrency=1)
+    scheduler.acquire(PRIORITY_BULK)
+
+    with pytest.raises(FCMTimeoutError):
+        scheduler.acquire(PRIORITY_BULK, timeout=0.05)
+    assert scheduler.waiting() == 0
+
+    async def run():
+        with pytest.raises(FCMTimeoutError):
+            await scheduler.acquire_async(PRIORITY_BULK, "a", timeout=0.05)
+
+    asyncio.run(run())
+    assert scheduler.waiting() == 0
+    scheduler.release()
+    assert scheduler.in_flight == 0
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+from pyfcm import Profiler
+from pyfcm.emulator import FCMEmulator
+
+
+def test_profiler_nested_stages():
+    profiler = Profiler()
+    with profiler.stage("notify"):
+        with profiler.stage("http"):
+            time.sleep(0.01)
+        with profiler.stage("parse_response"):
+            pass
+
+    stats = profiler.stats()
+    assert stats["notify"]["count"] == 1
+    assert stats["http"]["wall"] >= 0.01
+    assert stats["notify"]["wall"] >= stats["http"]["wall"]
+    assert sum(stats["http"]["histogram"]) == 1
+
+    collapsed = dict(line.rsplit(" ", 1) for line in profiler.collapsed().splitlines())
+    assert set(collapsed) == {"notify", "notify;http", "notify;parse_response"}
+    # self time only, the http stage is not counted twice
+    assert int(collapsed["notify"]) < int(collapsed["notify;http"])
+
+
+def test_profiler_aggregates_threads_and_coroutines():
+    profiler = Profiler()
+
+    def send():
+        for _ in range(100):
+            with profiler.stage("http"):
+                pass
+
+    threads = [threading.Thread(target=send) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    async def send_async():
+        with profiler.stage("http"):
+            with profiler.stage("parse_response"):
+                await asyncio.sleep(0)
+
+    async def batch():
+        with profiler.stage("async_batch"):
+            await asyncio.gather(*[send_async() for _ in range(50)])
+
+    asyncio.run(batch())
+
+    stats = profiler.stats()
+    assert stats["http"]["count"] == 450
+    assert stats["parse_response"]["count"] == 50
+    assert "async_batch;http;parse_response" in profiler.collapsed()
+
+
+def report_counts(report):
+    return {line.split()[0]: int(line.split()[1]) for line in report.splitlines()[1:]}
+
+
+def test_profiler_with_client(tmp_path):
+    reports = []
+    profiler = Profiler(report=reports.append, collapsed_path=tmp_path / "stacks.txt")
+    with FCMEmulator() as emulator:
+        fcm = emulator.client(profiler=profiler)
+        fcm.notify(fcm_token="device", notification_title="Hi")
+        fcm.async_notify_multiple_devices(
+            params_list=[{"fcm_token": f"device-{i}"} for i in range(20)]
+        )
+        stacks = (tmp_path / "stacks.txt").read_text()
+        fcm.async_notify_multiple_devices(
+            params_list=[{"fcm_token": f"device-{i}"} for i in range(5)]
+        )
+
+    # dumped at the end of each batch, covering what was timed since the previous dump
+    assert len(reports) == 2 and reports[0].splitlines()[0].startswith("stage")
+    counts = report_counts(reports[0])
+    assert counts["notify"] == 1
+    assert counts["parse_payload"] == 21
+    assert counts["json_dumps"] == 21
+    assert counts["token_refresh"] == 1
+    assert counts["http"] == 21
+    assert counts["parse_response"] == 21
+    assert "notify;parse_payload;json_dumps " in stacks
+    assert "async_batch;parse_payload;json_dumps " in stacks
+
+    counts = report_counts(reports[1])
+    assert "notify" not in counts
+    assert counts["http"] == 5
+    assert profiler.stats() == {}
+
+
+def test_profiler_dumped_when_batch_fails(mocker):
+    reports = []
+    profiler = Profiler(report=reports.append)
+    with FCMEmulator() as emulator:
+        fcm = emulator.client(profiler=profiler)
+        mocker.patch("pyfcm.async_fcm.fetch_tasks", side_effect=RuntimeError("boom"))
+        try:
+            fcm.async_notify_multiple_devices(params_list=[{"fcm_token": "device"}])
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("batch error was not raised")
+
+    assert len(reports) == 1
+    assert report_counts(reports[0])["async_batch"] == 1
@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+from pyfcm import async_fcm
+from pyfcm.responses import extract_error, extract_name
+
+ERROR_BODY = json.dumps(
+    {
+        "error": {
+            "code": 404,
+            "message": "Requested entity was not found.",
+            "status": "NOT_FOUND",
+            "details": [
+                {
+                    "@type": "type.googleapis.com/google.firebase.fcm.v1.FcmError",
+                    "errorCode": "UNREGISTERED",
+                }
+            ],
+        }
+    },
+    indent=2,
+).encode()
+
+
+def test_extract_name():
+    assert extract_name(b'{"name": "projects/p/messages/0:1"}') == (
+        "projects/p/messages/0:1"
+    )
+    assert extract_name(b'{\n  "name":"projects/p/messages/\\u0030"\n}') == (
+        "projects/p/messages/0"
+    )
+
+
+def test_extract_error():
+    assert extract_error(404, ERROR_BODY) == {
+        "error": {"code": 404, "status": "NOT_FOUND", "errorCode": "UNREGISTERED"}
+    }
+    assert extract_error(502, b"Bad Gateway") == {
+        "error": {"code": 502, "status": None, "errorCode": None}
+    }
+
+
+def test_parse_response_lean(base_api, mocker):
+    mocker.patch.object(base_api, "lean_responses", True)
+    response = mocker.Mock()
+    response.status_code = 200
+    response.headers = {}
+    response.content = b'{"name": "projects/p/messages/0:1"}'
+
+    assert base_api.parse_response(response) == "projects/p/messages/0:1"
+    response.json.assert_not_called()
+
+
+def test_is_access_token_expired_lean(base_api, mocker):
+    mocker.patch.object(base_api, "lean_responses", True)
+    response = mocker.Mock()
+    response.status_code = 401
+    response.content = b'{"error": {"details": [{"reason": "ACCESS_TOKEN_EXPIRED"}]}}'
+
+    assert base_api._is_access_token_expired(response)
+
+
+def test_async_send_request_lean(mocker):
+    response = mocker.MagicMock()
+    response.status = 404
+    response.read = mocker.AsyncMock(return_value=ERROR_BODY)
+    request = mocker.MagicMock()
+    request.__aenter__.return_value = response
+    session = mocker.MagicMock()
+    session.post.return_value = request
+    client_session = mocker.patch("pyfcm.async_fcm.aiohttp.ClientSession")
+    client_session.return_value.__aenter__.return_value = session
+
+    result = asyncio.run(async_fcm.send_request("end_point", {}, b"payload", lean=True))
+
+    assert result["error"]["errorCode"] == "UNREGISTERED"
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+from pyfcm import CallbackSink, NDJSONSink, SQLiteSink, async_fcm
+from pyfcm.emulator import FCMEmulator
+from pyfcm.sinks import make_record
+
+
+def test_make_record():
+    params = {"fcm_token": "token-1"}
+    assert make_record(0, params, {"name": "projects/test/messages/1"}) == {
+        "index": 0,
+        "fcm_token": "token-1",
+        "name": "projects/test/messages/1",
+        "error": None,
+    }
+    assert make_record(1, params, "projects/test/messages/2")["name"] == (
+        "projects/test/messages/2"
+    )
+
+    unregistered = {
+        "error": {
+            "code": 404,
+            "status": "NOT_FOUND",
+            "details": [{"errorCode": "UNREGISTERED"}],
+        }
+    }
+    assert make_record(2, params, unregistered)["error"] == "UNREGISTERED"
+    assert make_record(3, params, {"error": {"code": 500}})["error"] == "500"
+    assert make_record(4, params, None)["error"] == "DEFERRED"
+
+
+def test_callback_sink_flushes_on_size_and_time():
+    chunks = []
+    written = threading.Event()
+
+    def callback(records):
+        chunks.append([record["index"] for record in records])
+        written.set()
+
+    with CallbackSink(callback, batch_size=3, flush_interval=0.05) as sink:
+        for index in range(4):
+            sink.put({"index": index})
+        # the last record is written once the flush interval passes
+        assert written.wait(1)
+        sink.flush()
+
+    assert chunks == [[0, 1, 2], [3]]
+
+
+def test_sink_backpressure():
+    release = threading.Event()
+    sink = CallbackSink(lambda records: release.wait(), batch_size=1, max_pending=2)
+    sink.put({"index": 0})
+    sink.put({"index": 1})
+    sink.put({"index": 2})
+
+    blocked = threading.Thread(target=sink.put, args=({"index": 3},))
+    blocked.start()
+    blocked.join(0.1)
+    # the writer is stuck, so the sender waits instead of queueing more records
+    assert blocked.is_alive()
+
+    release.set()
+    blocked.join(1)
+    assert not blocked.is_alive()
+    sink.close()
+
+
+def test_sink_write_error_is_raised_to_the_sender():
+    def callback(records):
+        raise OSError("disk full")
+
+    sink = CallbackSink(callback, batch_size=1)
+    sink.put({"index": 0})
+    try:
+        sink.flush()
+    except OSError as e:
+        assert str(e) == "disk full"
+    else:
+        raise AssertionError("write error was not raised")
+
+
+def test_ndjson_and_sqlite_sinks(tmp_path):
+    records = [
+        {"index": i, "fcm_token": f"token-{i}", "name": None, "error": None}
+        for i in range(5)
+    ]
+
+    with NDJSONSink(tmp_path / "results.ndjson", batch_size=2) as sink:
+        for record in records:
+            sink.put(record)
+    with open(tmp_path / "results.ndjson") as f:
+        assert [json.loads(line) for line in f] == records
+
+    with SQLiteSink(str(tmp_path / "results.db"), batch_size=2) as sink:
+        for record in records:
+            sink.put(record)
+    connection = sqlite3.connect(str(tmp_path / "results.db"))
+    rows = connection.execute('SELECT * FROM fcm_results ORDER BY "index"').fetchall()
+    connection.close()
+    assert rows == [(i, f"token-{i}", None, None) for i in range(5)]
+
+
+def test_fetch_tasks_writes_to_sink(mocker):
+    async def fake_send_request(payload, **kwargs):
+        await asyncio.sleep(0)
+        if payload == "token-3":
+            return {"error": {"code": 404, "errorCode": "UNREGISTERED"}}
+        return {"name": f"projects/test/messages/{payload}"}
+
+    mocker.patch("pyfcm.async_fcm.send_request", side_effect=fake_send_request)
+    chunks = []
+    with CallbackSink(chunks.append, batch_size=4, max_pending=2) as sink:
+        result = asyncio.run(
+            async_fcm.fetch_tasks(
+                end_point="end_point",
+                headers={},
+                payloads=[{"fcm_token": f"token-{i}"} for i in range(10)],
+                timeout=5,
+                serialize=lambda params: params["fcm_token"],
+                concurrency=3,
+                sink=sink,
+            )
+        )
+        # every record is written by the time the batch returns
+        records = sorted(
+            (record for chunk in chunks for record in chunk),
+            key=lambda record: record["index"],
+        )
+
+    assert result is None
+    assert [record["fcm_token"] for record in records] == [
+        f"token-{i}" for i in range(10)
+    ]
+    assert records[3]["error"] == "UNREGISTERED"
+    assert records[4]["name"] == "projects/test/messages/token-4"
+
+
+def test_batches_into_slow_sink_do_not_leak_threads():
+    def slow_write(records):
+        time.sleep(0.001)
+
+    with FCMEmulator() as emulator:
+        fcm = emulator.client()
+        with CallbackSink(slow_write, batch_size=1, max_pending=1) as sink:
+            counts = []
+            for _ in range(4):
+                fcm.async_notify_multiple_devices(
+                    params_list=[{"fcm_token": f"device-{i}"} for i in range(20)],
+                    sink=sink,
+                )
+                counts.append(threading.active_count())
+
+    assert emulator.stats["sent"] == 80
+    assert counts[-1] <= counts[0]
+
+
+def test_closed_sink_rejects_records():
+    sink = CallbackSink(lambda records: None)
+    sink.put({"index": 0})
+    sink.close()
+
+    for call in (
+        lambda: sink.put({"index": 1}),
+        lambda: sink.put_nowait({"index": 1}),
+        sink.flush,
+    ):
+        try:
+            call()
+        except ValueError as e:
+            assert str(e) == "The sink is closed"
+        else:
+            raise AssertionError("closed sink accepted a record")
+    # closing again is harmless
+    sink.close()
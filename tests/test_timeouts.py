@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pyfcm import AdaptiveConcurrencyLimiter, async_fcm, errors
+from pyfcm.emulator import FCMEmulator
+from pyfcm.timeouts import (
+    Deadline,
+    Timeout,
+    aiohttp_timeout,
+    requests_timeout,
+    resolve_deadline,
+)
+
+
+def test_requests_timeout():
+    assert requests_timeout(30) == 30
+    assert requests_timeout(None) is None
+    assert requests_timeout(Timeout(connect=2, read=10)) == (2, 10)
+
+    deadline = Deadline(5)
+    connect, read = requests_timeout(Timeout(connect=2, read=10), deadline)
+    assert connect == 2
+    assert 4 < read <= 5
+    assert 4 < requests_timeout(None, deadline) <= 5
+
+
+def test_aiohttp_timeout():
+    assert aiohttp_timeout(5).total == 5
+
+    timeout = aiohttp_timeout(Timeout(connect=1, read=2, total=30), Deadline(10))
+    assert timeout.connect == 1
+    assert timeout.sock_read == 2
+    assert 9 < timeout.total <= 10
+
+
+def test_resolve_deadline_prefers_earliest():
+    assert resolve_deadline(30) is None
+    assert 9 < resolve_deadline(30, 10).remaining() <= 10
+    assert 4 < resolve_deadline(Timeout(total=5), 10).remaining() <= 5
+
+    deadline = Deadline(1)
+    assert resolve_deadline(Timeout(total=5), deadline) is deadline
+
+
+def test_deadline_check():
+    Deadline(10).check("anything")
+    with pytest.raises(errors.FCMTimeoutError):
+        Deadline(0).check("token refresh")
+
+
+def test_send_request_retry_after_past_deadline(base_api, mocker):
+    """Test that send_request does not sleep past the deadline"""
+
+    mock_sleep = mocker.patch("time.sleep")
+
+    retry_response = mocker.Mock()
+    retry_response.headers = {"Retry-After": "30"}
+
+    mock_session = mocker.Mock()
+    mock_session.post.side_effect = [retry_response]
+
+    base_api.thread_local = mocker.Mock()
+    base_api.thread_local.requests_session = mock_session
+    base_api.thread_local.token_expiry = time.time() + 1000
+
+    with pytest.raises(errors.FCMTimeoutError):
+        base_api.send_request(payload="test_payload", timeout=Timeout(total=5))
+
+    mock_sleep.assert_not_called()
+    connect, read = mock_session.post.call_args.kwargs["timeout"]
+    assert connect is not None and connect <= 5
+    assert read is not None and read <= 5
+
+
+def test_fetch_tasks_cancels_outstanding_requests_at_deadline(mocker):
+    async def fake_send_request(payload, **kwargs):
+        await asyncio.sleep(0 if payload == b"fast" else 10)
+        return {"name": payload.decode()}
+
+    mocker.patch("pyfcm.async_fcm.send_request", side_effect=fake_send_request)
+
+    started = time.monotonic()
+    results = asyncio.run(
+        async_fcm.fetch_tasks(
+            end_point="end_point",
+            headers={},
+            payloads=[b"fast", b"slow"],
+            timeout=5,
+            deadline=Deadline(0.1),
+        )
+    )
+
+    assert time.monotonic() - started < 5
+    assert results == [{"name": "fast"}, async_fcm.DEADLINE_EXCEEDED_RESPONSE]
+
+
+# Timeout.total bounds the whole batch, as a deadline does
+@pytest.mark.parametrize(
+    "timeout, deadline", [(5, 0.5), (Timeout(connect=5, read=5, total=0.5), None)]
+)
+def test_batch_deadline_shorter_than_request_timeout(timeout, deadline):
+    with FCMEmulator(latency=2.0) as emulator:
+        fcm = emulator.client()
+        started = time.monotonic()
+        results = fcm.async_notify_multiple_devices(
+            params_list=[{"fcm_token": f"device-{i}"} for i in range(3)],
+            timeout=timeout,
+            deadline=deadline,
+        )
+        elapsed = time.monotonic() - started
+
+    # answered at the deadline rather than after the emulator's latency
+    assert elapsed < 2
+    assert results == [async_fcm.DEADLINE_EXCEEDED_RESPONSE] * 3
+
+
+@pytest.fixture
+def unavailable_host():
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            requests_seen.append(self.path)
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", requests_seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_notify_retries_unavailable_within_deadline(
+    push_service, unavailable_host, mocker
+):
+    host, requests_seen = unavailable_host
+    mocker.patch.object(
+        push_service, "_fcm_end_point", host + "/v1/projects/test/messages:send"
+    )
+    mocker.patch.object(
+        push_service, "request_headers", return_value={"Authorization": "Bearer x"}
+    )
+
+    started = time.monotonic()
+    with pytest.raises(errors.FCMTimeoutError):
+        push_service.notify(
+            fcm_token="Test",
+            notification_body="Test",
+            timeout=Timeout(connect=1, read=1, total=2),
+        )
+
+    # retried at once, then gave up instead of sleeping 2s past the deadline
+    assert time.monotonic() - started < 2
+    assert len(requests_seen) == 2
+
+
+def test_send_request_backs_off_on_unavailable(base_api, mocker):
+    mock_sleep = mocker.patch("time.sleep")
+
+    unavailable_response = mocker.Mock()
+    unavailable_response.status_code = 503
+    unavailable_response.headers = {}
+
+    success_response = mocker.Mock()
+    success_response.status_code = 200
+    success_response.headers = {}
+
+    mock_session = mocker.Mock()
+    mock_session.post.side_effect = [unavailable_response] * 3 + [success_response]
+
+    base_api.thread_local = mocker.Mock()
+    base_api.thread_local.requests_session = mock_session
+    base_api.thread_local.token_expiry = time.time() + 1000
+
+    assert base_api.send_request(payload="test_payload", timeout=30) == success_response
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [2, 4]
+
+
+def test_notify_admission_bounded_by_deadline(push_service, mocker):
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+    limiter.acquire()
+    mocker.patch.object(push_service, "concurrency_limiter", limiter)
+    session = mocker.patch.object(
+        type(push_service), "requests_session", new_callable=mocker.PropertyMock
+    )
+
+    started = time.monotonic()
+    with pytest.raises(errors.FCMTimeoutError):
+        push_service.notify(fcm_token="Test", notification_body="Test", deadline=0.2)
+
+    assert time.monotonic() - started < 1
+    session.return_value.post.assert_not_called()
+    limiter.release()
+    assert limiter.in_flight == 0
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aiohttp
+import pytest
+
+from pyfcm import async_fcm
+
+
+@pytest.fixture
+def fcm_host():
+    client_ports = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_HEAD(self):
+            client_ports.add(self.client_address[1])
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", client_ports
+    server.shutdown()
+    server.server_close()
+
+
+def test_warmup_opens_connections(push_service, fcm_host, mocker):
+    host, client_ports = fcm_host
+    mocker.patch.object(
+        push_service, "_fcm_end_point", host + "/v1/projects/test/messages:send"
+    )
+    mocker.patch.object(push_service, "_warm_connections", 0)
+    mocker.patch.object(push_service, "_token_expiry", 0)
+    mocker.patch.object(push_service, "thread_local", threading.local())
+    request_headers = mocker.patch.object(
+        push_service, "request_headers", return_value={"Authorization": "Bearer x"}
+    )
+    # fewer threads than connections, each opens several
+    mocker.patch("pyfcm.baseapi.WARMUP_MAX_THREADS", 2)
+
+    assert push_service.warmup(connections=3) == 3
+
+    assert len(client_ports) == 3
+    assert push_service._warm_connections == 3
+
+    # requests from other threads reuse the warm connections and the token
+    def send():
+        session = push_service.requests_session
+        assert session.headers["Authorization"] == "Bearer x"
+        session.head(host).close()
+
+    threads = [threading.Thread(target=send) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(client_ports) == 3
+    # the token is fetched once, ahead of the first message
+    request_headers.assert_called_once()
+
+
+def test_async_warm_connections(fcm_host):
+    host, client_ports = fcm_host
+
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            return await async_fcm.warm_connections(
+                session, host + "/v1/projects/test/messages:send", 4
+            )
+
+    assert asyncio.run(run()) == 4
+    assert len(client_ports) == 4
+
+
+def test_warmup_without_connections(push_service, mocker):
+    mocker.patch.object(push_service, "_warm_connections", 5)
+    mocker.patch.object(push_service, "_token_expiry", 0)
+    mocker.patch("socket.getaddrinfo")
+    request_headers = mocker.patch.object(
+        push_service, "request_headers", return_value={"Authorization": "Bearer x"}
+    )
+    mocker.patch.object(push_service, "thread_local", threading.local())
+
+    assert push_service.warmup(connections=0) == 0
+    assert push_service._warm_connections == 0
+    request_headers.assert_called_once()
+
+
+def test_warmup_grows_pool(push_service, fcm_host, mocker):
+    host, client_ports = fcm_host
+    mocker.patch.object(
+        push_service, "_fcm_end_point", host + "/v1/projects/test/messages:send"
+    )
+    mocker.patch.object(push_service, "_warm_connections", 0)
+    mocker.patch.object(push_service, "pool_maxsize", 2)
+    mocker.patch.object(push_service, "_adapter", None)
+    mocker.patch.object(
+        push_service, "request_headers", return_value={"Authorization": "Bearer x"}
+    )
+    old_adapter = push_service.adapter
+    close = mocker.patch.object(old_adapter, "close")
+
+    assert push_service.warmup(connections=3) == 3
+
+    # the smaller pool is closed rather than left to the garbage collector
+    close.assert_called_once()
+    assert push_service.adapter is not old_adapter
+    assert push_service.adapter._pool_maxsize == 3